@@ -1,17 +1,17 @@
-import os
 from typing import List, TypedDict, Annotated, Dict
 import operator
 from dotenv import load_dotenv
 from pydantic import BaseModel, Field
 from langgraph.graph import StateGraph, END
-from langchain_openai import ChatOpenAI
 from langchain_core.messages import AnyMessage, SystemMessage, HumanMessage, AIMessage
-from langgraph.checkpoint.memory import MemorySaver
 from langgraph.prebuilt import ToolNode
 from datetime import datetime, timedelta
 import json
 
 from agenticcalendar.calendar_tools import calendar_tools
+from util.metrics import instrument, usage_handler
+from util.llm import get_chat_model, structured, with_tools, current_date
+from util.checkpointer import get_checkpointer
 
 _ = load_dotenv()
 
@@ -28,6 +28,7 @@ class AgentState(TypedDict):
     confirmation_needed: bool
     event_created: bool
     user_confirmed: bool
+    metrics: Annotated[List[Dict], operator.add]
 
 class EventExtraction(BaseModel):
     title: str = Field(description="Event title/subject")
@@ -40,14 +41,9 @@ class EventExtraction(BaseModel):
 
 class CalendarAgent():
     def __init__(self):
-        self.model = ChatOpenAI(
-            model="gpt-4o-mini",
-            base_url="https://models.inference.ai.azure.com",
-            api_key=os.environ['GITHUB_TOKEN'],
-            temperature=0
-        )
+        self.model = get_chat_model("gpt-4o-mini", temperature=0, callbacks=[usage_handler])
         
-        self.tool_model = self.model.bind_tools(tools=calendar_tools)
+        self.tool_model = with_tools(self.model, calendar_tools)
         self.tool_node = ToolNode(calendar_tools)
         
         # Prompts
@@ -77,10 +73,10 @@ class CalendarAgent():
         # Build the graph
         builder = StateGraph(AgentState)
         
-        builder.add_node("parser", self.parse_node)
-        builder.add_node("conflict_checker", self.conflict_check_node)
-        builder.add_node("confirmer", self.confirm_node)
-        builder.add_node("scheduler", self.schedule_node)
+        builder.add_node("parser", instrument("calendar", "parser", self.parse_node))
+        builder.add_node("conflict_checker", instrument("calendar", "conflict_checker", self.conflict_check_node))
+        builder.add_node("confirmer", instrument("calendar", "confirmer", self.confirm_node))
+        builder.add_node("scheduler", instrument("calendar", "scheduler", self.schedule_node))
         
         # Add edges
         builder.add_edge("parser", "conflict_checker")
@@ -94,7 +90,7 @@ class CalendarAgent():
         
         builder.set_entry_point("parser")
         
-        memory = MemorySaver()
+        memory = get_checkpointer("calendar")
         self.graph = builder.compile(
             checkpointer=memory,
             interrupt_before=["confirmer"]
@@ -102,12 +98,13 @@ class CalendarAgent():
     
     def parse_node(self, state: AgentState):
         """Extract event details from user request"""
-        current_date = datetime.now().strftime("%Y-%m-%d")
-        current_day = datetime.now().strftime("%A")
+        today = current_date()
+        current_date_text = today.strftime("%Y-%m-%d")
+        current_day = today.strftime("%A")
         
         enhanced_prompt = (
             f"{self.PARSE_PROMPT}\n"
-            f"Current date is {current_date} ({current_day}). "
+            f"Current date is {current_date_text} ({current_day}). "
             f"Use this as reference for relative dates like 'today', 'tomorrow', 'next week'."
         )
         
@@ -117,7 +114,7 @@ class CalendarAgent():
         ]
         
         try:
-            response = self.model.with_structured_output(EventExtraction).invoke(messages)
+            response = structured(self.model, EventExtraction).invoke(messages)
             
             # Auto-calculate end time if missing
             if not response.end_time and response.start_time:
@@ -315,6 +312,7 @@ class CalendarAgent():
         current_state = self.get_current_state(thread)
         if current_state and current_state.values:
             updated_values = current_state.values.copy()
+            updated_values.pop("metrics", None)  # reducer field, re-sending would duplicate records
             updated_values["user_confirmed"] = user_confirmed
             self.graph.update_state(thread, updated_values)
         
@@ -341,7 +339,8 @@ class CalendarAgent():
             "history": [],
             "confirmation_needed": False,
             "event_created": False,
-            "user_confirmed": False
+            "user_confirmed": False,
+            "metrics": []
         }
         
         thread = {"configurable": {"thread_id": thread_id}}
@@ -377,8 +376,8 @@ class CalendarAgent():
 # Test function
 def test_calendar_agent_interactive():
     agent = CalendarAgent()
-    today = datetime.now().strftime("%Y-%m-%d")
-    tomorrow = (datetime.now() + timedelta(days=1)).strftime("%Y-%m-%d")
+    today = current_date().strftime("%Y-%m-%d")
+    tomorrow = (current_date() + timedelta(days=1)).strftime("%Y-%m-%d")
     
     test_requests = [
         "Schedule a meeting with John tomorrow at 2 PM for 1 hour",
@@ -1,23 +1,24 @@
 import gradio as gr
 import io
+import pandas as pd
 from typing import List, Tuple
 from PIL import Image
 from datetime import datetime
 
 from agent import CalendarAgent
+from agenticcalendar.calendar_tools import get_calendar_api
+from util.metrics import METRIC_FIELDS, summarize, export_metrics
 
 class CalendarChatApp:
     def __init__(self):
         self.agent = CalendarAgent()
-        try:
-            from agenticcalendar.calendar_api import GoogleCalendarAPI
-            self.calendar_api = GoogleCalendarAPI()
-            self.api_connected = True
+        # same client as the agent tools, the service is built once per process
+        self.calendar_api = get_calendar_api()
+        self.api_connected = self.calendar_api is not None
+        if self.api_connected:
             self.logs = [f"✅ Connected to Google Calendar (Timezone: {self.calendar_api.timezone})"]
-        except Exception as e:
-            self.calendar_api = None
-            self.api_connected = False
-            self.logs = [f"❌ Failed to connect to Google Calendar: {str(e)}"]
+        else:
+            self.logs = ["❌ Failed to connect to Google Calendar"]
         
         self.current_thread_id = "default"
         self.pending_confirmation = None
@@ -28,6 +29,18 @@ class CalendarChatApp:
     def get_graph_image(self):
         return Image.open(io.BytesIO(self.graph.get_graph().draw_png()))
     
+    def get_metrics(self):
+        """Node metrics and per node summary for the current thread"""
+        thread = {"configurable": {"thread_id": self.current_thread_id}}
+        records = self.graph.get_state(thread).values.get("metrics", [])
+        return pd.DataFrame(records, columns=METRIC_FIELDS), pd.DataFrame(summarize(records))
+    
+    def export_thread_metrics(self):
+        """Export node metrics of the current thread to csv"""
+        thread = {"configurable": {"thread_id": self.current_thread_id}}
+        records = self.graph.get_state(thread).values.get("metrics", [])
+        return export_metrics(records, f"calendar_metrics_{self.current_thread_id}.csv")
+    
     def add_log(self, message: str):
         """Add a log entry with timestamp"""
         timestamp = datetime.now().strftime("%H:%M:%S")
@@ -85,7 +98,8 @@ class CalendarChatApp:
             "history": [],
             "confirmation_needed": False,
             "event_created": False,
-            "user_confirmed": False
+            "user_confirmed": False,
+            "metrics": []
         }
         
         thread = {"configurable": {"thread_id": self.current_thread_id}}
@@ -399,6 +413,16 @@ class CalendarChatApp:
                 graph_image = gr.Image(label="Graph State")
                 show_btn.click(fn=self.get_graph_image, inputs=None, outputs=graph_image)
             
+            with gr.Tab("Metrics"):
+                with gr.Row():
+                    refresh_btn = gr.Button("Refresh")
+                    export_btn = gr.Button("Export")
+                summary_df = gr.Dataframe(label="Per Node Summary")
+                metrics_df = gr.Dataframe(label="Node Metrics")
+                export_file = gr.File(label="Exported Metrics")
+                refresh_btn.click(fn=self.get_metrics, inputs=None, outputs=[metrics_df, summary_df])
+                export_btn.click(fn=self.export_thread_metrics, inputs=None, outputs=export_file)
+            
             # Event handlers
             def send_message(message, history):
                 result = self.chat_with_agent(message, history)
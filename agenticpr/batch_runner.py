@@ -0,0 +1,181 @@
+import os
+import json
+import time
+import hashlib
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dotenv import load_dotenv
+
+from agenticpr.multi_agent_repair import MultiAgentAPR, initial_state
+from agenticpr.validation import TestValidator, program_name
+from agenticpr.fingerprint import VerdictCache
+from agenticpr.results_store import ResultsStore, run_summary, thread_patches
+from agenticpr.beam_search import BeamSearch
+from agenticpr.fix_index import FixIndex
+from agenticpr.fault_localization import SpectrumLocalizer
+from util.knowledge_graph import KnowledgeGraph
+from util.rate_limiter import priority, BATCH
+
+_ = load_dotenv()
+
+
+def example_id(idx: int, example: dict) -> str:
+    digest = hashlib.sha1(example["buggy_code"].encode()).hexdigest()[:10]
+    return f"{idx}:{digest}"
+
+
+class BatchRunner():
+    """Runs the repair graph over every example without human interaction.
+    Interrupts are resumed automatically and one JSON line is appended per bug,
+    so a crashed run can be restarted and only the missing bugs are repaired"""
+    def __init__(self, agent, output, max_revisions=2, workers=4, validator=None, results=None, run_id=None,
+                 config=None, beam=None):
+        self.graph = agent.graph
+        self.fix_index = agent.fix_index
+        self.beam = beam
+        self.model = getattr(agent.model, "model_name", None)
+        self.output = output
+        self.max_revisions = max_revisions
+        self.workers = workers
+        self.validator = validator
+        self.results = results
+        self.run_id = run_id or time.strftime("%Y%m%d-%H%M%S")
+        self.config = config or {}
+        self.lock = threading.Lock()
+
+    def completed_ids(self) -> set:
+        done = set()
+        if os.path.exists(self.output):
+            with open(self.output) as f:
+                for line in f:
+                    try:
+                        done.add(json.loads(line)["id"])
+                    except (json.JSONDecodeError, KeyError):
+                        continue  # partial line from a crash
+        return done
+
+    def write_result(self, result: dict):
+        with self.lock:
+            with open(self.output, "a") as f:
+                f.write(json.dumps(result) + "\n")
+                f.flush()
+
+    def run_example(self, idx: int, example: dict) -> dict:
+        eid = example_id(idx, example)
+        thread_id = f"batch_{self.run_id}_{eid}"
+        thread = {"configurable": {"thread_id": thread_id}}
+        result = {"id": eid, "program": None}
+        start = time.perf_counter()
+        try:
+            result["program"] = program_name(example["buggy_code"])
+            # an attempt that crashed under the same run id left checkpoints with reduced metrics
+            delete_thread = getattr(self.graph.checkpointer, "delete_thread", None)
+            if delete_thread is not None:
+                delete_thread(thread_id)
+            if self.beam is not None:
+                with priority(BATCH):
+                    best = self.beam.search(example["buggy_code"], example["failed_tests"])
+                result.update(run_summary(best))
+                result["patches"] = best["candidates"]
+                result["validation"] = best["verdict"]
+            else:
+                config = initial_state(example["buggy_code"], example["failed_tests"], self.max_revisions)
+                with priority(BATCH):  # GUI sessions sharing the endpoint go first
+                    self.graph.invoke(config, thread)
+                    while self.graph.get_state(thread).next:
+                        self.graph.invoke(None, thread)
+                values = self.graph.get_state(thread).values
+                result.update(run_summary(values))
+                result["patches"] = thread_patches(self.graph, thread)
+                if self.validator is not None:
+                    result["validation"] = self.validator.validate(example["buggy_code"], values["fix_diff"])
+                else:
+                    result["validation"] = None
+        except Exception as e:
+            result["error"] = f"{type(e).__name__}: {e}"
+        result["latency"] = round(time.perf_counter() - start, 4)
+        return result
+
+    def run(self, examples):
+        done = self.completed_ids()
+        pending = [(idx, ex) for idx, ex in enumerate(examples) if example_id(idx, ex) not in done]
+        print(f"{len(done)} examples already done, {len(pending)} to run")
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            futures = {executor.submit(self.run_example, idx, ex): idx for idx, ex in pending}
+            for future in as_completed(futures):
+                idx = futures[future]
+                result = future.result()
+                self.write_result(result)
+                if self.results is not None:
+                    self.results.record_run(result, self.run_id, self.model, self.config,
+                                            validated=self.validator is not None or self.beam is not None)
+                if self.fix_index is not None and (result.get("validation") or {}).get("outcome") == "plausible":
+                    self.fix_index.add(examples[idx]["buggy_code"], result["patch"], result["explanation"])
+                outcome = (result.get("validation") or {}).get("outcome", result.get("error", "done"))
+                print(f"{result['program']}: {outcome} in {result['latency']}s")
+        if self.fix_index is not None and self.fix_index.path is not None:
+            self.fix_index.save()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run MultiAgentAPR over the example store without the GUI")
+    parser.add_argument("--examples", default="examples.json")
+    parser.add_argument("--output", default="batch_results.jsonl")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--max-revisions", type=int, default=2)
+    parser.add_argument("--validate", action="store_true", help="run the QuixBugs tests on each final patch")
+    parser.add_argument("--verdict-cache", default=None, help="SQLite file keeping test verdicts across runs")
+    parser.add_argument("--template-sweep", action="store_true", help="try one token mutations before the model")
+    parser.add_argument("--sweep-runs", type=int, default=15, help="most template mutants tested per program")
+    parser.add_argument("--results-db", default=None, help="SQLite results store to record every run in")
+    parser.add_argument("--run-id", default=None, help="label of this run in the results store")
+    parser.add_argument("--beam-width", type=int, default=0,
+                        help="keep this many partial fixes per revision, ranked by passing tests (0 disables)")
+    parser.add_argument("--expansions", type=int, default=2, help="candidates sampled per beam branch")
+    parser.add_argument("--ensemble", type=int, default=1, help="concurrent localizer calls merged by vote")
+    parser.add_argument("--ensemble-models", nargs="*", default=None, help="models the localizer voters rotate over")
+    parser.add_argument("--fix-index", default=None,
+                        help="index of past fixes shown to the repairer, plausible fixes of this run are added")
+    parser.add_argument("--repair-format", choices=["diff", "spans"], default="diff",
+                        help="repairer output: a unified diff or line edits against a numbered program")
+    parser.add_argument("--early-validation", action="store_true",
+                        help="stream the repairer answer and test the patch before its explanation is generated")
+    parser.add_argument("--workspace", default=None,
+                        help="project checkout whose call graph around the failing tests is shown to the localizer")
+    parser.add_argument("--sbfl", choices=["ochiai", "tarantula"], default=None,
+                        help="rank lines by per test coverage before localizing (runs every test with jacoco)")
+    args = parser.parse_args()
+
+    with open(args.examples) as f:
+        examples = json.load(f)
+    test_validator = TestValidator(cache=VerdictCache(args.verdict_cache), workers=args.workers)
+    validator = test_validator if args.validate else None
+    project_index = None
+    if args.workspace:
+        project_index = KnowledgeGraph(args.workspace, workers=args.workers)
+        print(f"Indexed {project_index.update()} changed java files of {args.workspace}")
+    spectrum = SpectrumLocalizer(test_validator, args.sbfl) if args.sbfl else None
+    # beam branches need diverse samples, a greedy model would expand every branch the same way
+    agent = MultiAgentAPR(template_sweep=args.template_sweep, validator=test_validator,
+                          temperature=0.7 if args.beam_width else 0, ensemble=args.ensemble,
+                          ensemble_models=args.ensemble_models,
+                          fix_index=FixIndex(args.fix_index) if args.fix_index else None,
+                          repair_format=args.repair_format, early_validation=args.early_validation,
+                          call_graph=project_index, knowledge_graph=project_index,
+                          spectrum=spectrum, sweep_runs=args.sweep_runs)
+    beam = BeamSearch(agent, test_validator, args.beam_width, args.expansions, args.max_revisions,
+                      args.workers) if args.beam_width else None
+    results = ResultsStore(args.results_db) if args.results_db else None
+    runner = BatchRunner(agent, args.output, args.max_revisions, args.workers, validator, results, args.run_id,
+                         config=vars(args), beam=beam)
+    try:
+        runner.run(examples)
+    finally:
+        test_validator.close()
+        if spectrum is not None:
+            spectrum.close()
+
+
+if __name__ == "__main__":
+    main()
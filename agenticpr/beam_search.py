@@ -0,0 +1,108 @@
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List
+
+from agenticpr.multi_agent_repair import initial_state
+from agenticpr.validation import program_name
+from util.metrics import instrument
+
+# verdicts that cannot be improved by revising the same patch
+HOPELESS = {"apply_failed", "syntax_error", "compile_error", "timeout"}
+REDUCED = ("count", "metrics")
+
+
+def merge(state: Dict, update: Dict) -> Dict:
+    """Apply a node update the way the graph reducers would"""
+    merged = dict(state)
+    for key, value in update.items():
+        merged[key] = merged.get(key, type(value)()) + value if key in REDUCED else value
+    return merged
+
+
+def score(verdict: Dict) -> int:
+    return -1 if verdict.get("outcome") in HOPELESS else verdict.get("passed", 0)
+
+
+class BeamSearch():
+    """Test guided search over repair revisions.
+
+    Instead of one localizer -> repairer -> reflector trajectory, every
+    revision expands each of the beam_width best branches `expansions` times
+    in parallel (sampling with a non zero temperature), validates the
+    candidates and keeps the ones passing the most tests. Candidates that do
+    not apply, parse or compile, duplicates of already seen patches and
+    candidates passing fewer tests than the buggy program are dropped"""
+    def __init__(self, agent, validator, beam_width=3, expansions=2, max_revisions=2, workers=4):
+        if min(beam_width, expansions, max_revisions) < 1:
+            raise ValueError(f"Beam search needs beam_width, expansions and max_revisions of at least 1, got "
+                             f"{beam_width}, {expansions} and {max_revisions}")
+        self.agent = agent
+        self.validator = validator
+        self.beam_width = beam_width
+        self.expansions = expansions
+        self.max_revisions = max_revisions
+        self.workers = workers
+        self.slice = instrument("apr_beam", "slicer", agent.slice_node)
+        self.sweep = instrument("apr_beam", "sweeper", agent.sweep_node)
+        self.understand = instrument("apr_beam", "understander", agent.understand_node)
+        self.localize = instrument("apr_beam", "localizer", agent.localizer_node)
+        self.repair = instrument("apr_beam", "repairer", agent.repairer_node)
+        self.reflect = instrument("apr_beam", "reflector", agent.reflect_node)
+
+    def _map(self, executor, fn, items) -> List:
+        # the priority class and other context variables must follow the calls into the pool
+        futures = [executor.submit(contextvars.copy_context().run, fn, item) for item in items]
+        return [future.result() for future in futures]
+
+    def expand(self, state: Dict) -> Dict:
+        state = merge(state, self.localize(state, None))
+        state = merge(state, self.repair(state, None))
+        state["verdict"] = self.validator.validate(state["buggy_program"], state["fix_diff"])
+        return state
+
+    def search(self, buggy_program: str, failed_tests: List[str]) -> Dict:
+        """Returns the best branch state, its verdict under "verdict", and every
+        candidate tried under "candidates" """
+        state = initial_state(buggy_program, failed_tests, self.max_revisions)
+        state = merge(state, self.slice(state, None))
+        if self.agent.template_repair is not None:
+            state = merge(state, self.sweep(state, None))
+            if state.get("fix_diff"):
+                state["verdict"] = self.validator.validate(buggy_program, state["fix_diff"])
+                return self.finish(state, [state])
+        state = merge(state, self.understand(state, None))
+        try:
+            baseline = self.validator.count_tests(program_name(buggy_program)) - len(failed_tests)
+        except (OSError, ValueError):
+            baseline = 0
+
+        beam, candidates, seen, best = [state], [], set(), None
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            for revision in range(self.max_revisions):
+                if revision > 0:
+                    beam = [merge(branch, update) for branch, update in
+                            zip(beam, self._map(executor, lambda b: self.reflect(b, None), beam))]
+                expanded = self._map(executor, self.expand, [b for b in beam for _ in range(self.expansions)])
+                candidates += expanded
+                survivors = []
+                for candidate in sorted(expanded, key=lambda c: score(c["verdict"]), reverse=True):
+                    if best is None or score(candidate["verdict"]) > score(best["verdict"]):
+                        best = candidate
+                    fingerprint = candidate["verdict"].get("fingerprint")
+                    if score(candidate["verdict"]) < baseline or fingerprint in seen:
+                        continue
+                    seen.add(fingerprint)
+                    survivors.append(candidate)
+                if best["verdict"].get("outcome") == "plausible" or not survivors:
+                    break
+                beam = survivors[:self.beam_width]
+        return self.finish(best, candidates)
+
+    def finish(self, best: Dict, candidates: List[Dict]) -> Dict:
+        best = dict(best)
+        # branches share the records of their common ancestors
+        best["metrics"] = list({id(m): m for c in candidates for m in c.get("metrics", [])}.values())
+        best["candidates"] = [{"revision": c["revision_number"] - 1, "patch": c["fix_diff"],
+                               "explanation": c["repairer_explanation"], "validation": c["verdict"]}
+                              for c in candidates]
+        return best
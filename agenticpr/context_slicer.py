@@ -0,0 +1,137 @@
+import re
+from functools import lru_cache
+from typing import Dict, List
+import tiktoken
+
+from util.java_source import extract_structure
+
+JAVA_KEYWORDS = {"if", "for", "while", "switch", "catch", "return", "new", "synchronized", "super", "this"}
+CHARS_PER_TOKEN = 4  # estimate when no encoding can be loaded
+
+
+@lru_cache(maxsize=None)
+def get_encoding(model: str):
+    """tiktoken encoding of the model, loaded once on first use. None if it
+    cannot be loaded, tiktoken downloads the BPE file and the box may be offline"""
+    try:
+        return tiktoken.encoding_for_model(model)
+    except Exception as e:
+        print(f"No tiktoken encoding for {model}, estimating tokens from characters: {e}")
+        return None
+
+
+def count_tokens(text: str, model: str = "gpt-4o") -> int:
+    encoding = get_encoding(model)
+    if encoding is None:
+        return -(-len(text) // CHARS_PER_TOKEN)
+    return len(encoding.encode(text))
+
+
+class ContextSlicer():
+    """Builds a reduced view of the buggy program for the agent prompts.
+    Keeps the package and imports, the methods reachable from the failing tests
+    plus a skeleton of the enclosing classes (headers, fields, elided
+    signatures) within a token budget. Gaps are marked with the original line
+    number of the next kept line"""
+    def __init__(self, token_budget=3000, model="gpt-4o"):
+        self.token_budget = token_budget
+        self.model = model
+
+    def count_tokens(self, text: str) -> int:
+        return count_tokens(text, self.model)
+
+    def called_names(self, failed_tests: List[str]) -> List[str]:
+        names = []
+        for test in failed_tests:
+            for name in re.findall(r"([A-Za-z_$][\w$]*)\s*\(", test):
+                if name not in JAVA_KEYWORDS and name not in names:
+                    names.append(name)
+        return names
+
+    def truncate(self, text: str) -> str:
+        if self.count_tokens(text) <= self.token_budget:
+            return text
+        encoding = get_encoding(self.model)
+        if encoding is None:
+            return text[:self.token_budget * CHARS_PER_TOKEN] + "\n// ... truncated"
+        return encoding.decode(encoding.encode(text)[:self.token_budget]) + "\n// ... truncated"
+
+    def slice(self, program: str, failed_tests: List[str]) -> str:
+        if self.count_tokens(program) <= self.token_budget:
+            return program
+        try:
+            structure = extract_structure(program)
+        except Exception as e:
+            print(f"Context slicing fell back to truncation: {e}")
+            return self.truncate(program)
+
+        lines = program.splitlines()
+        methods = structure.methods
+        by_name = {}
+        for method in methods:
+            by_name.setdefault(method["name"], []).append(method)
+
+        # breadth first from the methods the tests call, so the closest callees win the budget
+        ordered = []
+        frontier = [m for name in self.called_names(failed_tests) for m in by_name.get(name, [])]
+        while frontier:
+            next_frontier = []
+            for method in frontier:
+                if method in ordered:
+                    continue
+                ordered.append(method)
+                next_frontier.extend(m for call in method["calls"] for m in by_name.get(call["name"], []))
+            frontier = next_frontier
+        if not ordered:
+            ordered = list(methods)
+
+        pieces = {}
+        # package and imports cost a few tokens and a fix may need them
+        first = min((cls["start"] for cls in structure.classes), default=len(lines) + 1)
+        for n, line in enumerate(lines[:first - 1], 1):
+            if line.lstrip().startswith(("package ", "import ")):
+                pieces[n] = line
+        for cls in structure.classes:
+            line, column = cls["body_start"]
+            pieces[cls["start"]] = "\n".join(lines[cls["start"] - 1:line - 1] + [lines[line - 1][:column + 1]])
+            pieces[cls["stop"]] = lines[cls["stop"] - 1]
+        for field in structure.fields:
+            pieces[field["start"]] = "\n".join(lines[field["start"] - 1:field["stop"]])
+
+        used = self.count_tokens("\n".join(pieces.values()))
+        if used > self.token_budget:
+            return self.truncate(program)
+
+        marker = self.count_tokens("// line 1000\n")  # a kept method may need a line marker
+        for method in ordered:
+            text = "\n".join(lines[method["start"] - 1:method["stop"]])
+            cost = self.count_tokens(text) + marker
+            if used + cost > self.token_budget:
+                continue
+            pieces[method["start"]] = text
+            used += cost
+
+        for method in methods:
+            if method["start"] in pieces or method["body_start"] is None:
+                continue
+            line, column = method["body_start"]
+            text = "\n".join(lines[method["start"] - 1:line - 1] + [lines[line - 1][:column] + "{ ... }"])
+            cost = self.count_tokens(text) + marker
+            if used + cost > self.token_budget:
+                break
+            pieces[method["start"]] = text
+            used += cost
+
+        return with_line_markers(pieces)
+
+
+def with_line_markers(pieces: Dict[int, str]) -> str:
+    """Join pieces keyed by their first line, with a // line N marker wherever
+    lines were left out, so line numbers in a patch refer to the full program"""
+    blocks, next_line = [], 1
+    for start in sorted(pieces):
+        if start != next_line:
+            blocks.append(f"// line {start}")
+        blocks.append(pieces[start])
+        next_line = start + pieces[start].count("\n") + 1
+    return "\n".join(blocks)
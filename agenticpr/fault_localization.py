@@ -0,0 +1,171 @@
+import os
+import glob
+import shutil
+import hashlib
+import tempfile
+import threading
+import subprocess
+import xml.etree.ElementTree as ET
+from typing import Dict, List, Optional, Set
+import numpy as np
+
+from agenticpr.validation import program_name
+
+# Applies jacoco to the QuixBugs build without touching its build.gradle and
+# adds one Test task and one JacocoReport per test named in -PaprTests, all
+# run by a single gradle invocation of aprCoverage
+JACOCO_INIT = """
+allprojects {
+    apply plugin: 'jacoco'
+    afterEvaluate { project ->
+        def names = (project.findProperty('aprTests') ?: '').tokenize(',')
+        if (names.isEmpty() || !project.plugins.hasPlugin('java')) {
+            return
+        }
+        def coverage = project.tasks.register('aprCoverage')
+        names.eachWithIndex { name, i ->
+            def dir = project.layout.buildDirectory.dir("apr/${i}").get().asFile
+            def single = project.tasks.register("aprTest${i}", Test) {
+                testClassesDirs = project.sourceSets.test.output.classesDirs
+                classpath = project.sourceSets.test.runtimeClasspath
+                filter { includeTestsMatching name }
+                ignoreFailures = true  // a failing test must still get its coverage report
+                reports.junitXml.outputLocation.set(new File(dir, 'results'))
+                reports.html.required.set(false)
+                jacoco { destinationFile = new File(dir, 'jacoco.exec') }
+            }
+            def report = project.tasks.register("aprReport${i}", JacocoReport) {
+                dependsOn single
+                executionData.from(new File(dir, 'jacoco.exec'))
+                sourceSets project.sourceSets.main
+                reports {
+                    xml.required.set(true)
+                    xml.outputLocation.set(new File(dir, 'jacoco.xml'))
+                    html.required.set(false)
+                }
+            }
+            coverage.configure { dependsOn report }
+        }
+    }
+}
+"""
+RUNS = os.path.join("build", "apr")
+
+
+def line_coverage(report: str, source_file: str) -> Set[int]:
+    """Lines of source_file with at least one covered instruction in a jacoco xml report"""
+    covered = set()
+    for sourcefile in ET.parse(report).getroot().iter("sourcefile"):
+        if sourcefile.get("name") == source_file:
+            covered |= {int(line.get("nr")) for line in sourcefile.iter("line") if int(line.get("ci", 0)) > 0}
+    return covered
+
+
+def test_failed(results: str, test_class: str, test: str) -> Optional[bool]:
+    """Outcome of one test in the junit xml results of a gradle run, None if it did not run"""
+    for path in glob.glob(os.path.join(results, f"TEST-*{test_class}.xml")):
+        for case in ET.parse(path).getroot().iter("testcase"):
+            if case.get("name") == test and case.get("classname", "").split(".")[-1] == test_class:
+                return case.find("failure") is not None or case.find("error") is not None
+    return None
+
+
+def suspiciousness(matrix: np.ndarray, failed: np.ndarray) -> Dict[str, np.ndarray]:
+    """Ochiai and Tarantula scores per line of a tests x lines coverage matrix,
+    failed marks the failing tests"""
+    matrix = matrix.astype(bool)
+    total_failed, total_passed = failed.sum(), (~failed).sum()
+    ef = matrix[failed].sum(axis=0).astype(float)  # failing tests covering each line
+    ep = matrix[~failed].sum(axis=0).astype(float)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        ochiai = np.nan_to_num(ef / np.sqrt(total_failed * (ef + ep)))
+        fail_rate = ef / total_failed if total_failed else np.zeros_like(ef)
+        pass_rate = ep / total_passed if total_passed else np.zeros_like(ep)
+        tarantula = np.nan_to_num(fail_rate / (fail_rate + pass_rate))
+    return {"ochiai": ochiai, "tarantula": tarantula}
+
+
+class SpectrumLocalizer():
+    """Spectrum based fault localization pre-pass for the localizer.
+
+    Runs every junit test of the program on its own with jacoco line coverage,
+    one test task per test in a single gradle invocation, then ranks the lines
+    by how much more they are covered by failing than by passing tests.
+    Rankings are kept per program source in the validator's verdict cache, so
+    revisions and repeated runs with a persisted cache do not rerun gradle"""
+    def __init__(self, validator, formula: str = "ochiai", top: int = 5):
+        self.validator = validator
+        self.formula = formula
+        self.top = top
+        self.lock = threading.Lock()
+        self.init_script = None
+
+    def _init_script(self) -> str:
+        with self.lock:
+            if self.init_script is None:
+                with tempfile.NamedTemporaryFile("w", suffix=".gradle", prefix="apr_jacoco_", delete=False) as f:
+                    f.write(JACOCO_INIT)
+                self.init_script = f.name
+        return self.init_script
+
+    def run_tests(self, program: str, name: str, tests: List[str]) -> List[Dict]:
+        """Covered lines of the program and the outcome of each test that ran"""
+        command = ["gradle", "aprCoverage", f"-PaprTests={','.join(f'{name}_TEST.{test}' for test in tests)}",
+                   "--console=plain", "--init-script", self._init_script()]
+        with self.validator.workspaces.acquire() as workspace:
+            workspace.write(os.path.join("java_programs", f"{name}.java"), program)
+            runs_dir = os.path.join(workspace.path, RUNS)
+            shutil.rmtree(runs_dir, ignore_errors=True)  # left by the previous user of the slot
+            try:
+                subprocess.run(command, cwd=workspace.path, capture_output=True, text=True,
+                               timeout=self.validator.timeout)
+            except subprocess.TimeoutExpired:
+                raise RuntimeError(f"Coverage run of {name} timed out")
+            runs = []
+            for i, test in enumerate(tests):
+                report = os.path.join(runs_dir, str(i), "jacoco.xml")
+                failed = test_failed(os.path.join(runs_dir, str(i), "results"), f"{name}_TEST", test)
+                if failed is not None and os.path.exists(report):
+                    runs.append({"test": test, "failed": failed, "covered": line_coverage(report, f"{name}.java")})
+        if not runs:
+            raise RuntimeError(f"No coverage for the tests of {name}, does the program compile?")
+        return runs
+
+    def spectrum(self, program: str) -> Optional[Dict]:
+        name = program_name(program)
+        runs = self.run_tests(program, name, self.validator.test_names(name))
+        if not any(run["failed"] for run in runs):
+            return None  # nothing to localize without a failing test
+        lines = sorted(set().union(*(run["covered"] for run in runs)))
+        column = {line: i for i, line in enumerate(lines)}
+        matrix = np.zeros((len(runs), len(lines)), dtype=bool)
+        for row, run in enumerate(runs):
+            matrix[row, [column[line] for line in run["covered"]]] = True
+        return {"lines": np.array(lines), "matrix": matrix, "failed": np.array([run["failed"] for run in runs])}
+
+    def rank(self, program: str) -> List[Dict]:
+        """Most suspicious lines first, as {"line", "score", "text"}"""
+        # keyed by the exact source, line numbers differ between equivalent programs
+        key = f"sbfl:{self.formula}:{self.top}:{hashlib.sha256(program.encode()).hexdigest()}"
+        return self.validator.cache.get_or_run(key, lambda: {"ranking": self._rank(program)})["ranking"]
+
+    def _rank(self, program: str) -> List[Dict]:
+        spectrum = self.spectrum(program)
+        if spectrum is None:
+            return []
+        scores = suspiciousness(spectrum["matrix"], spectrum["failed"])[self.formula]
+        source = program.splitlines()
+        order = np.argsort(-scores, kind="stable")[:self.top]
+        return [{"line": int(spectrum["lines"][i]), "score": round(float(scores[i]), 3),
+                 "text": source[spectrum["lines"][i] - 1].strip()}
+                for i in order if scores[i] > 0 and spectrum["lines"][i] <= len(source)]
+
+    def close(self):
+        with self.lock:
+            if self.init_script is not None and os.path.exists(self.init_script):
+                os.unlink(self.init_script)
+            self.init_script = None
+
+
+def format_ranking(ranking: List[Dict]) -> str:
+    return "\n".join(f"line {r['line']} ({r['score']}): {r['text']}" for r in ranking)
@@ -0,0 +1,135 @@
+import json
+import sqlite3
+import hashlib
+import threading
+from concurrent.futures import Future
+from typing import override, Callable, Dict, List
+from antlr4 import ParseTreeWalker, Token
+
+from util.JavaLexer import JavaLexer
+from util.JavaListener import JavaListener
+from util.java_source import parse_java
+from util.metrics import bump
+
+
+class LocalNames(JavaListener):
+    """Collects the locals, parameters and catch variables declared in each
+    method or constructor, with the token range of the declaring member"""
+    def __init__(self):
+        self.scopes = []  # (start token index, stop token index, [names in declaration order])
+        self.declarations = set()  # token index of every declared name
+        self._stack = []
+
+    def _enter_member(self, ctx):
+        scope = (ctx.start.tokenIndex, ctx.stop.tokenIndex, [])
+        self.scopes.append(scope)
+        self._stack.append(scope)
+
+    def _declare(self, identifier):
+        name = identifier.getText()
+        if self._stack:
+            self.declarations.add(identifier.symbol.tokenIndex)
+            if name not in self._stack[-1][2]:
+                self._stack[-1][2].append(name)
+
+    @override
+    def enterMethodDeclaration(self, ctx):
+        self._enter_member(ctx)
+
+    @override
+    def exitMethodDeclaration(self, ctx):
+        self._stack.pop()
+
+    @override
+    def enterConstructorDeclaration(self, ctx):
+        self._enter_member(ctx)
+
+    @override
+    def exitConstructorDeclaration(self, ctx):
+        self._stack.pop()
+
+    @override
+    def enterVariableDeclaratorId(self, ctx):
+        self._declare(ctx.Identifier())
+
+    @override
+    def enterCatchClause(self, ctx):
+        self._declare(ctx.Identifier())
+
+
+def normalized_tokens(source: str) -> List[str]:
+    """Default channel tokens of the program with locals renamed to v0, v1, ...
+    per method, so whitespace, comments, brace style and temporary names do not
+    matter. Falls back to the plain tokens if the program does not parse"""
+    tree, parser = parse_java(source)
+    tokens = [t for t in parser.getTokenStream().tokens if t.type != Token.EOF]
+    texts = [t.text for t in tokens]
+    previous, last = [], None  # previous default channel token of each token
+    for token in tokens:
+        previous.append(last)
+        if token.channel == Token.DEFAULT_CHANNEL:
+            last = token.text
+    if parser.getNumberOfSyntaxErrors() == 0:
+        names = LocalNames()
+        ParseTreeWalker().walk(names, tree)
+        for start, stop, declared in sorted(names.scopes):  # inner members are renamed last
+            renames = {name: f"v{i}" for i, name in enumerate(declared)}
+            for i in range(start, stop + 1):
+                token = tokens[i]
+                if token.type != JavaLexer.Identifier or token.text not in renames:
+                    continue
+                if previous[i] == ".":  # obj.count is a field, not the local
+                    continue
+                texts[i] = renames[token.text]
+    return [text for token, text in zip(tokens, texts) if token.channel == Token.DEFAULT_CHANNEL]
+
+
+def patch_fingerprint(patched: str) -> str:
+    """Hash of the normalized patched program, equal for equivalent candidates"""
+    return hashlib.sha256("\0".join(normalized_tokens(patched)).encode()).hexdigest()
+
+
+class VerdictCache():
+    """Validation verdicts by patch fingerprint, optionally persisted in SQLite.
+    Concurrent requests for the same fingerprint wait for the first run"""
+    def __init__(self, path: str = None):
+        self.lock = threading.Lock()
+        self.verdicts = {}
+        self.running = {}
+        self.conn = None
+        if path is not None:
+            self.conn = sqlite3.connect(path, check_same_thread=False)
+            self.conn.execute("CREATE TABLE IF NOT EXISTS verdicts (fingerprint TEXT PRIMARY KEY, verdict TEXT)")
+            self.conn.commit()
+            for fingerprint, verdict in self.conn.execute("SELECT fingerprint, verdict FROM verdicts"):
+                self.verdicts[fingerprint] = json.loads(verdict)
+
+    def get_or_run(self, fingerprint: str, run: Callable[[], Dict]) -> Dict:
+        with self.lock:
+            if fingerprint in self.verdicts:
+                bump("cache_hits")
+                return {**self.verdicts[fingerprint], "cached": True}
+            future = self.running.get(fingerprint)
+            owner = future is None
+            if owner:
+                future = self.running[fingerprint] = Future()
+        if not owner:
+            bump("cache_hits")
+            return {**future.result(), "cached": True}
+        try:
+            verdict = run()
+        except Exception as e:
+            with self.lock:
+                del self.running[fingerprint]
+            future.set_exception(e)
+            raise
+        with self.lock:
+            del self.running[fingerprint]
+            if verdict.get("outcome") != "timeout":  # a timeout may pass on a less loaded machine
+                self.verdicts[fingerprint] = verdict
+                if self.conn is not None:
+                    self.conn.execute("INSERT OR REPLACE INTO verdicts VALUES (?, ?)",
+                                      (fingerprint, json.dumps(verdict)))
+                    self.conn.commit()
+        future.set_result(verdict)
+        return verdict
@@ -0,0 +1,168 @@
+import os
+import json
+import difflib
+import hashlib
+import threading
+from typing import Dict, List, Tuple
+import numpy as np
+
+from agenticpr.test_serializer import TOKEN
+from agenticpr.validation import PatchError, apply_patch, program_name
+from agenticpr.span_edits import focus_ranges
+from util.java_source import extract_structure
+
+
+def buggy_methods(program: str, fix_diff: str) -> str:
+    """Source of the methods a fix changes, the whole program if that cannot be told"""
+    try:
+        patched = apply_patch(program, fix_diff)
+        methods = extract_structure(program).methods
+    except (PatchError, ValueError):
+        return program
+    lines = program.splitlines()
+    changed = [(i1, max(i2, i1 + 1)) for tag, i1, i2, _, _ in
+               difflib.SequenceMatcher(None, lines, patched.splitlines(), autojunk=False).get_opcodes()
+               if tag != "equal"]
+    touched = [m for m in methods if any(m["start"] - 1 <= i1 and i2 <= m["stop"] for i1, i2 in changed)]
+    # the innermost method only, an enclosing class body would drown the bug
+    touched = [m for m in touched if not any(o is not m and m["start"] <= o["start"] and o["stop"] <= m["stop"]
+                                             for o in touched)]
+    if not touched:
+        return program
+    return "\n".join("\n".join(lines[m["start"] - 1:m["stop"]]) for m in touched)
+
+
+def localized_methods(program: str, statements: List[str]) -> str:
+    """Search query for a bug: source of the methods holding the localized
+    statements, or all methods without the class shell every QuixBugs file
+    shares, which would otherwise dominate the similarity"""
+    lines = program.splitlines()
+    ranges = focus_ranges(program, statements)
+    if ranges == [(1, len(lines))]:
+        try:
+            methods = extract_structure(program).methods
+        except ValueError:
+            return program
+        ranges = [(m["start"], m["stop"]) for m in methods
+                  if not any(o is not m and o["start"] <= m["start"] and m["stop"] <= o["stop"] for o in methods)]
+    return "\n".join("\n".join(lines[start - 1:stop]) for start, stop in ranges) or program
+
+
+class HashingEmbedder():
+    """Bag of java tokens and token bigrams hashed into a fixed size vector.
+    Needs no model, similar code shares most of its tokens"""
+    def __init__(self, dim: int = 1024):
+        self.dim = dim
+        self.name = f"hashing-{dim}"
+
+    def _bucket(self, feature: str) -> int:
+        # hashlib, python's hash() changes between processes and the index is persisted
+        return int.from_bytes(hashlib.md5(feature.encode()).digest()[:4], "little") % self.dim
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            tokens = TOKEN.findall(text)
+            for feature in tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]:
+                vectors[row, self._bucket(feature)] += 1.0
+        return np.log1p(vectors)
+
+
+class SentenceEmbedder():
+    """Local sentence-transformers model, e.g. a code embedding model"""
+    def __init__(self, model_name: str):
+        from sentence_transformers import SentenceTransformer
+        self.model = SentenceTransformer(model_name)
+        self.name = model_name
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        return np.asarray(self.model.encode(texts), dtype=np.float32)
+
+
+def get_embedder():
+    """FIX_INDEX_EMBEDDER names a sentence-transformers model, hashing if unset or not installed"""
+    model_name = os.environ.get("FIX_INDEX_EMBEDDER", "hashing")
+    if model_name != "hashing":
+        try:
+            return SentenceEmbedder(model_name)
+        except ImportError:
+            print("sentence-transformers is not installed, using the hashing embedder")
+    return HashingEmbedder()
+
+
+class FixIndex():
+    """Past (buggy method, fix diff) pairs with top-k cosine search.
+
+    Vectors are kept normalized in one NumPy matrix, so a search is a single
+    matrix vector product. Persisted as <path>.npz and <path>.json"""
+    def __init__(self, path: str = None, embedder=None):
+        self.path = path
+        self.embedder = embedder or get_embedder()
+        self.lock = threading.Lock()
+        self.entries = []
+        self.keys = set()
+        self.vectors = np.zeros((0, 0), dtype=np.float32)
+        if path is not None and os.path.exists(f"{path}.json"):
+            self.load()
+
+    def _normalize(self, vectors: np.ndarray) -> np.ndarray:
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.where(norms == 0, 1, norms)
+
+    def add(self, program: str, fix_diff: str, explanation: str = "") -> bool:
+        """Index a validated fix of program, False if it is already indexed"""
+        method = buggy_methods(program, fix_diff)
+        key = hashlib.sha1(f"{method}\0{fix_diff}".encode()).hexdigest()
+        vector = self._normalize(self.embedder.embed([method]))
+        with self.lock:
+            if key in self.keys:
+                return False
+            if self.vectors.shape[1] != vector.shape[1]:
+                self.vectors = np.zeros((0, vector.shape[1]), dtype=np.float32)
+            if len(self.entries) == len(self.vectors):  # grow by doubling instead of copying on every add
+                grown = np.zeros((max(16, 2 * len(self.vectors)), vector.shape[1]), dtype=np.float32)
+                grown[:len(self.vectors)] = self.vectors
+                self.vectors = grown
+            self.vectors[len(self.entries)] = vector[0]
+            self.entries.append({"key": key, "program": program_name(program), "method": method,
+                                 "fix_diff": fix_diff, "explanation": explanation})
+            self.keys.add(key)
+        return True
+
+    def search(self, query: str, k: int = 3, min_score: float = 0.5, exclude: str = None) -> List[Tuple[float, Dict]]:
+        """Top k entries by cosine similarity to query, best first. Entries of
+        the program named `exclude` are skipped, e.g. to keep benchmark answers out"""
+        with self.lock:
+            count = len(self.entries)
+            if count == 0:
+                return []
+            vectors, entries = self.vectors[:count], list(self.entries)
+        scores = vectors @ self._normalize(self.embedder.embed([query]))[0]
+        if exclude is not None:
+            scores = np.where([e["program"] == exclude for e in entries], -1.0, scores)
+        top = np.argpartition(-scores, min(k, count) - 1)[:k] if count > k else np.arange(count)
+        top = top[np.argsort(-scores[top])]
+        return [(float(scores[i]), entries[i]) for i in top if scores[i] >= min_score]
+
+    def save(self):
+        with self.lock:
+            np.savez(f"{self.path}.npz", vectors=self.vectors[:len(self.entries)])
+            with open(f"{self.path}.json", "w") as f:
+                json.dump({"embedder": self.embedder.name, "entries": self.entries}, f)
+
+    def load(self):
+        with open(f"{self.path}.json") as f:
+            data = json.load(f)
+        if data["embedder"] != self.embedder.name:
+            print(f"Fix index {self.path} was built with {data['embedder']}, re-embedding with {self.embedder.name}")
+            vectors = self._normalize(self.embedder.embed([e["method"] for e in data["entries"]]))
+        else:
+            vectors = np.load(f"{self.path}.npz")["vectors"]
+        self.entries = data["entries"]
+        self.keys = {e["key"] for e in self.entries}
+        self.vectors = vectors.astype(np.float32)
+
+
+def format_examples(matches: List[Tuple[float, Dict]]) -> str:
+    return "".join(f"#{i} buggy:\n{entry['method']}\nfix:\n{entry['fix_diff']}\n"
+                   for i, (score, entry) in enumerate(matches))
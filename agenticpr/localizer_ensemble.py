@@ -0,0 +1,47 @@
+import math
+from typing import Dict, List
+
+from agenticpr.test_serializer import TOKEN, render
+
+
+def normalize_statement(statement: str) -> str:
+    """Statement text without whitespace differences or the trailing semicolon,
+    so voters quoting the same line with other formatting agree"""
+    return render(TOKEN.findall(statement.strip().rstrip(";")))
+
+
+def vote(responses: List, quorum: float = 0.5) -> Dict:
+    """Merge Localizer responses by majority.
+
+    A statement is kept if more than `quorum` of the voters name it. If no
+    statement reaches the quorum the most voted ones are kept, so the repairer
+    always gets a location. The repair hypothesis comes from the voter that
+    agrees most with the consensus"""
+    counts, first = {}, {}
+    for voter, response in enumerate(responses):
+        explanations = list(response.localizer_explanations)
+        for i, statement in enumerate(response.buggy_stmts):
+            key = normalize_statement(statement)
+            if not key or voter in counts.get(key, set()):
+                continue
+            counts.setdefault(key, set()).add(voter)
+            first.setdefault(key, (statement, explanations[i] if i < len(explanations) else ""))
+    if not counts:
+        return {"buggy_stmts": [], "localizer_explanations": [],
+                "repair_hypothesis": responses[0].repair_hypothesis if responses else "", "votes": []}
+
+    needed = math.floor(len(responses) * quorum) + 1
+    consensus = [key for key in counts if len(counts[key]) >= needed]
+    if not consensus:
+        top = max(len(voters) for voters in counts.values())
+        consensus = [key for key in counts if len(counts[key]) == top]
+    consensus.sort(key=lambda key: -len(counts[key]))  # stable, ties keep the order they were first named in
+
+    agreement = [sum(voter in counts[key] for key in consensus) for voter in range(len(responses))]
+    best = max(range(len(responses)), key=lambda voter: agreement[voter])
+    return {
+        "buggy_stmts": [first[key][0] for key in consensus],
+        "localizer_explanations": [f"({len(counts[key])}/{len(responses)} votes) {first[key][1]}" for key in consensus],
+        "repair_hypothesis": responses[best].repair_hypothesis,
+        "votes": [len(counts[key]) for key in consensus],
+    }
@@ -4,21 +4,35 @@ import json
 from dotenv import load_dotenv
 from PIL import Image
 import gradio as gr
+import pandas as pd
 from typing import List
-from agenticpr.multi_agent_repair import MultiAgentAPR
+from agenticpr.multi_agent_repair import MultiAgentAPR, initial_state
+from agenticpr.results_store import ResultsStore, run_summary, thread_patches
+from agenticpr.fix_index import FixIndex
+from util.knowledge_graph import KnowledgeGraph
+from agenticpr.validation import program_name
+from util.metrics import METRIC_FIELDS, summarize, export_metrics
+from util.checkpointer import existing_threads
+from util.streaming import stream_until_interrupt
+from util.speculation import Speculator
 
 _ = load_dotenv()
 
 class APRGui(): 
-    def __init__(self, graph, share=False):
+    def __init__(self, graph, share=False, speculate=False, results=None):
         self.graph = graph
         self.share = share
+        # finished threads are recorded here when a ResultsStore is given
+        self.results = results
+        # opt-in: run the next node in the background while the user reviews the last one
+        self.speculator = Speculator(graph) if speculate else None
         self.partial_response = ""
         self.response = {}
         self.max_iterations = 10
-        self.iterations = []
-        self.threads = []
-        self.thread_id = -1
+        # continue numbering after threads persisted by a previous run
+        self.threads = sorted(int(t) for t in existing_threads(graph.checkpointer) if str(t).isdigit())
+        self.thread_id = self.threads[-1] if self.threads else -1
+        self.iterations = [0] * (self.thread_id + 1)
         self.thread = {"configurable": {"thread_id": str(self.thread_id)}}
         self.demo = self.create_interface()
         
@@ -28,21 +42,7 @@ class APRGui():
         failed_tests = failed_tests.split("\n--\n")
         if start: # if a new thread is started
             self.iterations.append(0)
-            config = {
-                "buggy_program": buggy_code,
-                "failed_tests": failed_tests,
-                "lnode": "",
-                "localizer_hypothesis": "",
-                "buggy_stmts": [],
-                "localizer_explanations": [],
-                "repair_hypothesis": "",
-                "fix_diff": "",
-                "repairer_explanation": "",
-                "revision": "",
-                "revision_number": 1,
-                "max_revisions": 2,
-                "count": 0,
-                }
+            config = initial_state(buggy_code, failed_tests)
             self.thread_id += 1
             self.threads.append(self.thread_id)
         else:
@@ -50,18 +50,36 @@ class APRGui():
         
         self.thread = {"configurable": {"thread_id": str(self.thread_id)}}
         while self.iterations[self.thread_id] < self.max_iterations:
-            self.response = self.graph.invoke(config, self.thread)
+            committed = self.speculator.commit(self.thread) if self.speculator and config is None else None
+            if committed is not None:
+                for node, update in committed:
+                    self.partial_response += f"{node}: {update}"
+                    self.partial_response += f"\n------------------\n\n"
+                yield self.partial_response
+            else:
+                live = ""
+                for kind, node, data in stream_until_interrupt(self.graph, config, self.thread):
+                    if kind == "token":  # show tokens as they arrive, replaced by the node output once it completes
+                        live += data
+                        yield self.partial_response + f"[{node}] {live}"
+                    else:
+                        live = ""
+                        self.partial_response += f"{node}: {data}"
+                        self.partial_response += "\n------------------\n\n"
+                        yield self.partial_response
+            self.response = self.graph.get_state(self.thread).values
             self.iterations[self.thread_id] += 1
-            self.partial_response += str(self.response)
-            self.partial_response += f"\n------------------\n\n"
-            lnode, nnode, thread_id, rev, acount = self.get_disp_state()            
-            yield self.partial_response, lnode, nnode, thread_id, rev, acount
+            lnode, nnode, thread_id, rev, acount = self.get_disp_state()
             config = None 
             print(f"Completed {lnode} step. Next step is {nnode}")
             if not nnode:
+                if self.results is not None:
+                    self.record_result()
                 return
             if lnode in stop_after:
                 print(f"Stopping after {lnode}")
+                if self.speculator:
+                    self.speculator.speculate(self.thread)
                 return
             else:
                 print(f"Continuing to {nnode}")
@@ -135,10 +153,13 @@ class APRGui():
         return (None)
 
     def copy_state(self, hist_str):
+        if self.speculator:
+            self.speculator.discard(self.thread)
         thread_ts = hist_str.split(":")[-1]
         config = self.find_config(thread_ts)
         state = self.graph.get_state(config)
-        self.graph.update_state(self.thread, state.values, as_node=state.values['lnode'])
+        values = {k: v for k, v in state.values.items() if k != "metrics"}
+        self.graph.update_state(self.thread, values, as_node=state.values['lnode'])
         new_state = self.graph.get_state(self.thread)
         new_thread_ts = new_state.config['configurable']['checkpoint_id']
         tid = new_state.config['configurable']['thread_id']
@@ -157,14 +178,40 @@ class APRGui():
         return self.thread_id
     
     def modify_state(self, key, asnode, new_state):
+        if self.speculator:
+            self.speculator.discard(self.thread)
         current_values = self.graph.get_state(self.thread).values
         current_values[key] = new_state
+        current_values.pop("metrics", None)
         self.graph.update_state(self.thread, current_values, as_node=asnode)
         return
     
     def get_graph_image(self):
         return Image.open(io.BytesIO(self.graph.get_graph().draw_png()))
     
+    def get_metrics(self):
+        records = self.graph.get_state(self.thread).values.get("metrics", [])
+        return pd.DataFrame(records, columns=METRIC_FIELDS), pd.DataFrame(summarize(records))
+    
+    def export_thread_metrics(self):
+        records = self.graph.get_state(self.thread).values.get("metrics", [])
+        return export_metrics(records, f"apr_metrics_thread_{self.thread_id}.csv")
+    
+    
+    def record_result(self):
+        values = self.graph.get_state(self.thread).values
+        try:
+            program = program_name(values["buggy_program"])
+        except ValueError:
+            program = None
+        result = {"id": f"gui_{self.thread_id}", "program": program, "validation": None,
+                  **run_summary(values), "patches": thread_patches(self.graph, self.thread)}
+        self.results.record_run(result, "gui")
+
+    def get_results(self):
+        if self.results is None:
+            return pd.DataFrame()
+        return pd.DataFrame(self.results.compare(group_by="program"))
     
     def create_interface(self):
         with gr.Blocks(theme=gr.themes.Default()) as demo:
@@ -333,9 +380,32 @@ class APRGui():
                 explanation_bx = gr.Textbox(label="Repairer Explanation", lines=10, interactive=True)
                 refresh_btn.click(fn=self.get_state, inputs=gr.Number("fix_diff", visible=False),outputs=fix_diff_bx).then(
                                  fn=self.get_state, inputs=gr.Number("repairer_explanation", visible=False), outputs=explanation_bx)
+            
+            with gr.Tab("Metrics"):
+                with gr.Row():
+                    refresh_btn = gr.Button("Refresh")
+                    export_btn = gr.Button("Export")
+                summary_df = gr.Dataframe(label="Per Node Summary")
+                metrics_df = gr.Dataframe(label="Node Metrics")
+                export_file = gr.File(label="Exported Metrics")
+                results_df = gr.Dataframe(label="Recorded Runs per Program")
+                refresh_btn.click(fn=self.get_metrics, inputs=None, outputs=[metrics_df, summary_df]).then(
+                                  fn=self.get_results, inputs=None, outputs=results_df)
+                export_btn.click(fn=self.export_thread_metrics, inputs=None, outputs=export_file)
         return demo
     
 if __name__ == "__main__":
-    agent = MultiAgentAPR()
-    gui = APRGui(agent.graph)
+    project_index = None
+    if os.environ.get("APR_WORKSPACE"):
+        project_index = KnowledgeGraph(os.environ["APR_WORKSPACE"])
+        project_index.update()
+    agent = MultiAgentAPR(template_sweep=os.environ.get("TEMPLATE_SWEEP", "0") == "1",
+                          sweep_runs=int(os.environ.get("TEMPLATE_SWEEP_RUNS", "15")),
+                          ensemble=int(os.environ.get("LOCALIZER_ENSEMBLE", "1")),
+                          fix_index=FixIndex(os.environ["FIX_INDEX"]) if os.environ.get("FIX_INDEX") else None,
+                          repair_format=os.environ.get("REPAIR_FORMAT", "diff"),
+                          early_validation=os.environ.get("EARLY_VALIDATION", "0") == "1",
+                          call_graph=project_index, knowledge_graph=project_index)
+    results = ResultsStore(os.environ["RESULTS_DB"]) if os.environ.get("RESULTS_DB") else None
+    gui = APRGui(agent.graph, speculate=os.environ.get("SPECULATE", "0") == "1", results=results)
     gui.demo.launch()
\ No newline at end of file
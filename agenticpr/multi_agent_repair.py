@@ -1,35 +1,56 @@
-import os
-from typing import List, TypedDict, Annotated, Dict
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, TypedDict, Annotated, Dict
 import operator
 from dotenv import load_dotenv
 from pydantic import BaseModel, Field
 from langgraph.graph import StateGraph, END
-from langchain_openai import ChatOpenAI
-from langchain_core.messages import AnyMessage, SystemMessage, HumanMessage, AIMessage
-from langgraph.checkpoint.memory import MemorySaver
+from langchain_core.messages import AnyMessage, SystemMessage, HumanMessage, AIMessage, ToolMessage
+from langchain_core.tools import tool
 from IPython.display import Image, display
 from langsmith.wrappers import wrap_openai
 
+from agenticpr.context_slicer import ContextSlicer
+from agenticpr.validation import TestValidator, PatchError, check_patch, check_syntax, format_errors, program_name
+from agenticpr.template_repair import TemplateRepair
+from agenticpr.test_serializer import TestSerializer, compact_tests
+from agenticpr.localizer_ensemble import vote
+from agenticpr.fix_index import format_examples, localized_methods
+from agenticpr.fault_localization import format_ranking
+from agenticpr.span_edits import focus_ranges, numbered, apply_edits, unified_diff, format_edits
+from util.metrics import instrument, bump, usage_handler
+from util.llm import get_chat_model, structured, forced_tool, with_tools
+from util.streaming import stream_fields
+from util.checkpointer import get_checkpointer
+
 _ = load_dotenv()
 
 class AgentState(TypedDict):
     # Understand the project and the bug
-    # knowledge_graph: str 
+    # Classes around the failing tests from the project knowledge graph, if any
+    knowledge_graph: str
     buggy_program: str 
     failed_tests: List[str]
+    # Methods reachable from the failed tests plus the class skeleton
+    program_context: str
     lnode: str
     # Hypothesize the bug for the localizer agent
     localizer_hypothesis: str
+    # Lines ranked by spectrum based fault localization, if enabled
+    suspicious_lines: List[Dict]
     buggy_stmts: List[str]
     localizer_explanations: List[str]
     # Hypothesize the bug for the repair agent
     repair_hypothesis: str
     fix_diff: str
     repairer_explanation: str
+    # Problems of the last candidate patch that did not apply or parse
+    patch_errors: List[Dict]
     self_reflection: str
     revision_number: int
     max_revisions: int
     count: Annotated[int, operator.add]
+    metrics: Annotated[List[Dict], operator.add]
  
 class Localizer(BaseModel):
     buggy_stmts: List[str] = Field(description="Buggy statement(s) in the code")
@@ -40,88 +61,230 @@ class Repair(BaseModel):
     fix_diff: str = Field(description="Patch diff for the fix")
     repairer_explanation: str = Field(description="Explanation for the fix")
 
+class Edit(BaseModel):
+    start: int = Field(description="First line to replace")
+    end: int = Field(description="Last line to replace, inclusive. start - 1 to insert before start")
+    replacement: str = Field(description="New source lines with indentation, empty to delete the lines")
+
+class SpanRepair(BaseModel):
+    edits: List[Edit] = Field(description="Line edits against the numbered program")
+    repairer_explanation: str = Field(description="Explanation for the fix")
+
 class MultiAgentAPR():
-    def __init__(self):
-        self.model = ChatOpenAI(
-            model="gpt-4o",
-            base_url="https://models.inference.ai.azure.com",
-            api_key=os.environ['GITHUB_TOKEN'],
-            temperature=0
-        )
+    def __init__(self, context_budget=3000, syntax_retries=2, template_sweep=False, validator=None, temperature=0,
+                 ensemble=1, ensemble_models=None, fix_index=None, few_shots=3, repair_format="diff",
+                 early_validation=False, call_graph=None, call_hops=2, knowledge_graph=None, max_queries=2,
+                 spectrum=None, sweep_runs=15):
+        self.model = get_chat_model("gpt-4o", temperature=temperature, callbacks=[usage_handler])
+        # ensemble > 1 runs that many localizer calls at once and keeps the statements most of them agree on
+        self.ensemble = ensemble
+        self.ensemble_models = [get_chat_model(name, temperature=temperature, callbacks=[usage_handler])
+                                for name in ensemble_models or []] or [self.model]
+        self.slicer = ContextSlicer(token_budget=context_budget)
+        # optional FixIndex of validated past fixes, the closest ones are shown to the repairer
+        self.fix_index = fix_index
+        self.few_shots = few_shots
+        self.test_serializer = TestSerializer()
+        self.syntax_retries = syntax_retries
+        # "diff": the repairer writes a unified diff, "spans": line edits against a numbered excerpt
+        self.repair_format = repair_format
+        # stream the repair and check, then test, the patch while the explanation is still generated
+        self.early_validation = early_validation
+        self.validator = validator
+        self.validation_pool = ThreadPoolExecutor(max_workers=2) if early_validation and validator else None
+        # optional util.call_graph.CallGraph of the project, for bugs spanning several classes
+        self.call_graph = call_graph
+        self.call_hops = call_hops
+        # optional util.knowledge_graph.KnowledgeGraph the understander can query
+        self.knowledge_graph = knowledge_graph
+        self.max_queries = max_queries
+        self.kg_tool = self.knowledge_graph_tool() if knowledge_graph is not None else None
+        # optional SpectrumLocalizer, ranks lines by test coverage before the first model call
+        self.spectrum = spectrum
+        # opt-in: try one token mutations against the tests before any model call
+        self.template_repair = (TemplateRepair(validator or TestValidator(), max_runs=sweep_runs)
+                                if template_sweep else None)
         builder = StateGraph(AgentState)
-        # self.PLAN_PROMPT = ("You are a expert developer working on a project." 
-        #                    "Your task is to understand the project you are working on."
-        #                    "You are given a project knowledge graph. You can also generate queries" 
-        #                    "(if needed) to understand the project better. Only generate two queries max.")
-        self.UNDERSTAND_PROMPT = ("You are an expert developer tasked to provide a hypothesis on the bug."
-                                  "You are provided with the buggy program and the failed test cases."
+        self.PLAN_PROMPT = ("You are also given an overview of the project knowledge graph. You can query the "
+                            "graph (if needed) to understand the project better. Only generate two queries max.")
+
+        # Every node sends SYSTEM_PROMPT and the program/tests block first, so all calls of a thread share
+        # one identical prefix the provider can cache. Node instructions follow in the last message.
+        self.SYSTEM_PROMPT = ("You are part of a team of expert agents repairing a bug in a Java program. "
+                              "The first message holds the buggy program and its failed test cases. "
+                              "The last message tells you your role and task.")
+
+        self.UNDERSTAND_PROMPT = ("You are an expert developer tasked to provide a hypothesis on the bug. "
+                                  "Use the buggy program and the failed test cases above. "
                                   "Only answer with brief hypothesis on the bug for the fault localizer agent.")
         
-        self.LOCALIZER_PROMPT = ("You are an expert fault localizer agent tasked to locate the buggy statement(s)"
-                                 "and provide one explanation for each statement. Only answer with the statement(s)"
-                                 "that you think are buggy and their explanation for user. Provide  hypothesis on"
-                                 "the bug for the repair agent. If the user provides a revision, respond with revised buggy statement(s)"
-                                 "explanation and hypothesis. Given below is the suspicious code block: \n"
-                                 "------\n"
-                                 "buggy program: {buggy_program}\n")
+        self.LOCALIZER_PROMPT = ("You are an expert fault localizer agent tasked to locate the buggy statement(s) "
+                                 "and provide one explanation for each statement. Only answer with the statement(s) "
+                                 "that you think are buggy and their explanation for user. Provide hypothesis on "
+                                 "the bug for the repair agent. If a review of a previous fix is given, respond with "
+                                 "revised buggy statement(s), explanation and hypothesis.")
+        # ensemble voters look at the bug from different angles, the shared prefix stays the same
+        self.LOCALIZER_VARIANTS = ["",
+                                   "Trace the failing test inputs through the code before answering.",
+                                   "Check boundary conditions, operators and loop updates first.",
+                                   "Compare what the tests expect with what each statement computes."]
         
-        self.REPAIR_PROMPT = ("You are an expert repair agent tasked to fix the bug. Return a fix with an explanation"
-                              "in form of a patch diff, instead of a full re-write of the code"
-                              "Given below is the suspicious code block: \n"
-                              "------\n"
-                              "buggy program: {buggy_program}\n")
+        self.REPAIR_PROMPT = ("You are an expert repair agent tasked to fix the bug. Return a fix with an explanation "
+                              "in form of a patch diff, instead of a full re-write of the code. Hunk headers "
+                              "use the line numbers of the full program, an abridged program marks them with "
+                              "// line N comments.")
+        self.SPAN_REPAIR_PROMPT = ("You are an expert repair agent tasked to fix the bug. Return a fix with an "
+                                   "explanation as line edits against the numbered lines below. Each edit replaces "
+                                   "lines start to end with the replacement lines, keep the indentation. Only edit "
+                                   "the lines that change.")
         
-        self.REFLECTION_PROMPT = ("You are an expert code reviewer tasked to review the fix"
-                                "If all the test case pass else generate recommendation"
+        self.REFLECTION_PROMPT = ("You are an expert code reviewer tasked to review the fix. "
+                                "If all the test case pass else generate recommendation "
                                 "for improvement of the repair to pass all test cases")  # TODO: Tool utlization to place the fix and run the test cases
         
-        builder.add_node("understander", self.understand_node)
-        builder.add_node("localizer", self.localizer_node)
-        builder.add_node("repairer", self.repairer_node)
-        builder.add_node("reflector", self.reflect_node)
+        builder.add_node("slicer", instrument("apr", "slicer", self.slice_node))
+        builder.add_node("understander", instrument("apr", "understander", self.understand_node))
+        builder.add_node("localizer", instrument("apr", "localizer", self.localizer_node))
+        builder.add_node("repairer", instrument("apr", "repairer", self.repairer_node))
+        builder.add_node("reflector", instrument("apr", "reflector", self.reflect_node))
         
         builder.add_conditional_edges("repairer",
                                       self.should_continue,
                                       {END:END, "reflect":"reflector"})
         
+        if self.template_repair is not None:
+            builder.add_node("sweeper", instrument("apr", "sweeper", self.sweep_node))
+            builder.add_edge("slicer", "sweeper")
+            builder.add_conditional_edges("sweeper",
+                                          self.should_understand,
+                                          {END: END, "understand": "understander"})
+        else:
+            builder.add_edge("slicer", "understander")
         builder.add_edge("understander", "localizer")
         builder.add_edge("localizer", "repairer")
         builder.add_edge("reflector", "localizer")
         
-        builder.set_entry_point("understander")
+        builder.set_entry_point("slicer")
         
-        memory = MemorySaver()
+        memory = get_checkpointer("apr")
         self.graph = builder.compile(
             checkpointer=memory,
             interrupt_before=["localizer", "repairer", "reflector"]
         )
         
-    def understand_node(self, state:AgentState):
-        failed_test_cases="".join([f"#{str(i)}\n\
-                             {test}\n\
-                             ------\n" for i, test in enumerate(state["failed_tests"])])
-        content=f"Buggy program\n\
-                {state['buggy_program']}\n\
-                ------\n\
-                Failed test cases\n\
-                {failed_test_cases}"
-        messages = [
-            SystemMessage(content=self.UNDERSTAND_PROMPT),
-            HumanMessage(content=content)
+    def slice_node(self, state:AgentState):
+        program_context = self.slicer.slice(state["buggy_program"], state["failed_tests"])
+        bump("saved_tokens", self.test_serializer.savings(state["failed_tests"])["saved_tokens"])
+        suspicious_lines = []
+        if self.spectrum is not None:
+            try:
+                suspicious_lines = self.spectrum.rank(state["buggy_program"])
+            except Exception as e:
+                print(f"Spectrum based fault localization failed: {e}")
+        return {
+            "program_context": program_context,
+            "suspicious_lines": suspicious_lines,
+            "lnode": "slicer",
+            "count": 1
+        }
+
+    def sweep_node(self, state:AgentState):
+        try:
+            mutant = self.template_repair.sweep(state["buggy_program"], state["failed_tests"],
+                                                [line["line"] for line in state.get("suspicious_lines") or []])
+        except Exception as e:
+            print(f"Template sweep failed: {e}")
+            mutant = None
+        if mutant is None:
+            return {
+                "lnode": "sweeper",
+                "count": 1
+            }
+        return {
+            "fix_diff": mutant.diff,
+            "repairer_explanation": mutant.explanation(),
+            "lnode": "sweeper",
+            "count": 1
+        }
+
+    def should_understand(self, state:AgentState):
+        if state.get("fix_diff"):
+            return END
+        return "understand"
+
+    def build_messages(self, state: AgentState, instructions: str, content: str = "") -> List[AnyMessage]:
+        """System prompt, then the shared program and tests block, then the node specific part"""
+        task = f"{instructions}\n------\n{content}" if content else instructions
+        return [
+            SystemMessage(content=self.SYSTEM_PROMPT),
+            HumanMessage(content=shared_context(state)),
+            HumanMessage(content=task)
         ]
-        response = self.model.invoke(messages)
+
+    def knowledge_graph_tool(self):
+        kg = self.knowledge_graph
+
+        @tool
+        def query_knowledge_graph(kind: str, name: str) -> str:
+            """Look up the project knowledge graph. kind is "class" (file, superclass, fields, methods and
+            subclasses of a class), "method" (callers and callees of Class.method), "tests" (tests reaching
+            a Class or Class.method) or "subclasses" (classes extending a class)."""
+            return kg.query(kind, name)
+
+        return query_knowledge_graph
+
+    def understand_node(self, state:AgentState):
+        if self.knowledge_graph is None:
+            messages = self.build_messages(state, self.UNDERSTAND_PROMPT)
+            response = self.model.invoke(messages)
+            return {
+                "localizer_hypothesis": response.content,
+                "lnode": "understander",
+                "count": 1
+            }
+        overview = self.knowledge_graph.overview(state["failed_tests"], test_class=junit_class(state["buggy_program"]))
+        messages = self.build_messages(state, f"{self.UNDERSTAND_PROMPT} {self.PLAN_PROMPT}",
+                                       f"project knowledge graph:\n{overview}")
+        model = with_tools(self.model, [self.kg_tool])
+        for query in range(self.max_queries + 1):
+            # the last round runs without tools, so the answer is a hypothesis and not another query
+            response = (model if query < self.max_queries else self.model).invoke(messages)
+            if not response.tool_calls:
+                break
+            messages.append(response)
+            for call in response.tool_calls:
+                messages.append(ToolMessage(content=self.kg_tool.invoke(call["args"]), tool_call_id=call["id"]))
         return {
+            "knowledge_graph": overview,
             "localizer_hypothesis": response.content,
             "lnode": "understander",
             "count": 1
         }
-    
+
     def localizer_node(self, state:AgentState):
-        messages = [
-            SystemMessage(content=self.LOCALIZER_PROMPT.format(buggy_program=state["buggy_program"])),
-            HumanMessage(content=state["localizer_hypothesis"])
-        ]
-        response = self.model.with_structured_output(Localizer).invoke(messages)
+        content = f"hypothesis: {state['localizer_hypothesis']}\n"
+        if state.get("self_reflection"):
+            content += (
+                f"------\n"
+                f"previous fix:\n{state['fix_diff']}\n"
+                f"------\n"
+                f"review of the previous fix: {state['self_reflection']}\n"
+            )
+        if state.get("suspicious_lines"):
+            content += (
+                f"------\n"
+                f"most suspicious lines by test coverage (line, score):\n"
+                f"{format_ranking(state['suspicious_lines'])}\n"
+            )
+        if self.call_graph is not None:
+            methods = self.call_graph.neighborhood(state["failed_tests"], k=self.call_hops,
+                                                   test_class=junit_class(state["buggy_program"]))
+            if methods:
+                content += f"------\nproject methods called from the failing tests:\n{self.call_graph.render(methods)}"
+        if self.ensemble > 1:
+            return {**self.localize_ensemble(state, content), "lnode": "localizer", "count": 1}
+        messages = self.build_messages(state, self.LOCALIZER_PROMPT, content)
+        response = structured(self.model, Localizer).invoke(messages)
         return {
             "repair_hypothesis": response.repair_hypothesis,
             "buggy_stmts": response.buggy_stmts,
@@ -129,46 +292,123 @@ class MultiAgentAPR():
             "lnode": "localizer",
             "count": 1
         }
-        
+
+    def localize_ensemble(self, state: AgentState, content: str) -> Dict:
+        def ask(voter):
+            variant = self.LOCALIZER_VARIANTS[voter % len(self.LOCALIZER_VARIANTS)]
+            model = self.ensemble_models[voter % len(self.ensemble_models)]
+            messages = self.build_messages(state, f"{self.LOCALIZER_PROMPT} {variant}".strip(), content)
+            try:
+                return structured(model, Localizer).invoke(messages)
+            except Exception as e:
+                print(f"Localizer voter {voter} failed: {e}")
+                return None
+
+        with ThreadPoolExecutor(max_workers=self.ensemble) as executor:
+            # each call runs in a copy of this context so its usage lands in the node metrics
+            futures = [executor.submit(contextvars.copy_context().run, ask, voter) for voter in range(self.ensemble)]
+            responses = [r for r in (future.result() for future in futures) if r is not None]
+        if not responses:
+            raise RuntimeError("Every localizer voter failed")
+        merged = vote(responses)
+        return {
+            "repair_hypothesis": merged["repair_hypothesis"],
+            "buggy_stmts": merged["buggy_stmts"],
+            "localizer_explanations": merged["localizer_explanations"],
+        }
+
     def repairer_node(self, state:AgentState):
-        content= f"buggy statement(s): {state['buggy_stmts']}\n\
-                   ------\n\
-                   hypothesis: {state['repair_hypothesis']}\n"
-        messages = [
-            SystemMessage(content=self.REPAIR_PROMPT.format(buggy_program=state["buggy_program"])),
-            HumanMessage(content=content)
-        ]
-        response = self.model.with_structured_output(Repair).invoke(messages)
+        content = (
+            f"buggy statement(s): {state['buggy_stmts']}\n"
+            f"------\n"
+            f"hypothesis: {state['repair_hypothesis']}\n"
+        )
+        if self.fix_index is not None:
+            try:
+                program = program_name(state["buggy_program"])
+            except ValueError:
+                program = None
+            # fixes of the same benchmark program would hand the model its answer
+            query = localized_methods(state["buggy_program"], state["buggy_stmts"])
+            matches = self.fix_index.search(query, k=self.few_shots, exclude=program)
+            if matches:
+                content += f"------\nfixes of similar bugs:\n{format_examples(matches)}"
+        if self.repair_format == "spans":
+            ranges = focus_ranges(state["buggy_program"], state["buggy_stmts"])
+            content += f"------\nnumbered program:\n{numbered(state['buggy_program'], ranges)}\n"
+        feedback = ""
+        # malformed patches are rejected in milliseconds and sent back with the parser errors
+        for attempt in range(self.syntax_retries + 1):
+            fix_diff, explanation, errors, rejected = self.propose_fix(state, content + feedback)
+            if not errors:
+                break
+            feedback = (
+                f"------\n"
+                f"Your previous patch was rejected before running the tests:\n"
+                f"{rejected}\n"
+                f"errors:\n{format_errors(errors)}\n"
+                f"Return a corrected patch.\n"
+            )
         return {
-            "fix_diff": response.fix_diff,
-            "repairer_explanation": response.repairer_explanation,
+            "fix_diff": fix_diff,
+            "repairer_explanation": explanation,
+            "patch_errors": errors,
             "revision_number": state.get("revision_number", 1) + 1,
             "lnode": "repairer",
             "count": 1
         }
 
+    def propose_fix(self, state: AgentState, content: str):
+        """One repairer call. Returns the fix as a unified diff, the explanation,
+        the problems found before testing and the fix as the model wrote it"""
+        spans = self.repair_format == "spans"
+        schema, prompt = (SpanRepair, self.SPAN_REPAIR_PROMPT) if spans else (Repair, self.REPAIR_PROMPT)
+        messages = self.build_messages(state, prompt, content)
+        if not self.early_validation:
+            response = structured(self.model, schema).invoke(messages)
+            fix_diff, errors, rejected = self.check_fix(state, response.edits if spans else response.fix_diff)
+            return fix_diff, response.repairer_explanation, errors, rejected
+        checked, explanation = None, ""
+        # the patch field comes first in the schema, so it is complete long before the explanation
+        for name, value in stream_fields(forced_tool(self.model, schema), messages):
+            if name == "repairer_explanation":
+                explanation = value
+            elif name in ("fix_diff", "edits"):
+                checked = self.check_fix(state, [Edit(**edit) for edit in value] if spans else value)
+                if checked[1]:
+                    break  # rejected, the explanation is not worth waiting for
+                if self.validation_pool is not None:
+                    # the verdict lands in the validator's cache, later validate calls only wait for it
+                    self.validation_pool.submit(contextvars.copy_context().run, self.validator.validate,
+                                                state["buggy_program"], checked[0])
+        if checked is None:
+            raise ValueError("The repairer answer has no patch")
+        return checked[0], explanation, checked[1], checked[2]
+
+    def check_fix(self, state: AgentState, fix):
+        """Unified diff, problems found before testing, and the fix as written by the model"""
+        if self.repair_format != "spans":
+            return fix, check_patch(state["buggy_program"], fix), fix
+        edits = format_edits(fix)
+        try:
+            patched = apply_edits(state["buggy_program"], fix)
+        except PatchError as e:
+            return edits, [{"line": None, "column": None, "token": None, "message": f"edits do not apply: {e}"}], edits
+        # shown and validated as a unified diff like the free text patches
+        return unified_diff(state["buggy_program"], patched), check_syntax(state["buggy_program"], patched), edits
+
     def reflect_node(self, state: AgentState):
-        failed_test_cases = "".join([
-            f"#{i}\n{test}\n------\n" for i, test in enumerate(state["failed_tests"])
-        ])
         content = (
-            f"Buggy program\n"
-            f"{state['buggy_program']}\n"
-            f"------\n"
-            f"Failed test cases\n"
-            f"{failed_test_cases}\n"
-            f"------\n"
             f"Identified buggy statement(s) by Localizer agent\n"
             f"{[f'#{i}: {stmt}' for i, stmt in enumerate(state['buggy_stmts'])]}\n"
             f"------\n"
             f"Provided fix by Repairer agent\n"
             f"{state['fix_diff']}"
         )
-        message = [
-            SystemMessage(content=self.REFLECTION_PROMPT),
-            HumanMessage(content=content),
-        ]
-        response = self.model.invoke(message)
+        if state.get("patch_errors"):
+            content += f"\n------\nThe fix does not apply or parse\n{format_errors(state['patch_errors'])}"
+        messages = self.build_messages(state, self.REFLECTION_PROMPT, content)
+        response = self.model.invoke(messages)
         return {
             "self_reflection": response.content,
             "lnode": "reflector",
@@ -180,14 +420,54 @@ class MultiAgentAPR():
             return END
         return "reflect"
 
+def junit_class(program: str) -> Optional[str]:
+    """QuixBugs junit class of the program, None if it has no class"""
+    try:
+        return f"{program_name(program)}_TEST"
+    except ValueError:
+        return None
+
+
+def shared_context(state: Dict) -> str:
+    """Program and tests block, byte identical for every node of a thread"""
+    failed_test_cases = compact_tests(state["failed_tests"])
+    return (
+        f"Buggy program\n"
+        f"{state['program_context']}\n"
+        f"------\n"
+        f"Failed test cases\n"
+        f"{failed_test_cases}"
+    )
+
+def initial_state(buggy_program: str, failed_tests: List[str], max_revisions: int = 2) -> Dict:
+    return {
+        "buggy_program": buggy_program,
+        "failed_tests": failed_tests,
+        "program_context": "",
+        "knowledge_graph": "",
+        "lnode": "",
+        "localizer_hypothesis": "",
+        "suspicious_lines": [],
+        "buggy_stmts": [],
+        "localizer_explanations": [],
+        "repair_hypothesis": "",
+        "fix_diff": "",
+        "repairer_explanation": "",
+        "patch_errors": [],
+        "self_reflection": "",
+        "revision_number": 1,
+        "max_revisions": max_revisions,
+        "count": 0,
+        "metrics": [],
+    }
+
 def draw_graph():
     agent = MultiAgentAPR()
     display(Image(agent.graph.get_graph().draw_png()))
 
 
 def test_model_with_defined_input():
-    config = {
-        "buggy_program": "public class BITCOUNT {\n\
+    buggy_program = "public class BITCOUNT {\n\
                         public static int bitcount(int n) {\n\
                             int count = 0;\n\
                             while (n != 0) {\n\
@@ -196,30 +476,19 @@ def test_model_with_defined_input():
                             }\n\
                         return count;\n\
                         }\n\
-                    }",
-        "failed_tests": [
-            "@org.junit.Test(timeout = 3000) public void test_0() throws java.lang.Exception { int result = java_programs.BITCOUNT.bitcount((int)127); org.junit.Assert.assertEquals( (int) 7, result); }",
-            "@org.junit.Test(timeout = 3000) public void test_1() throws java.lang.Exception { int result = java_programs.BITCOUNT.bitcount((int)128); org.junit.Assert.assertEquals( (int) 1, result); }",
-            "@org.junit.Test(timeout = 3000) public void test_2() throws java.lang.Exception { int result = java_programs.BITCOUNT.bitcount((int)3005); org.junit.Assert.assertEquals( (int) 9, result); }",
-            "@org.junit.Test(timeout = 3000) public void test_3() throws java.lang.Exception { int result = java_programs.BITCOUNT.bitcount((int)13); org.junit.Assert.assertEquals( (int) 3, result); }",
-            "@org.junit.Test(timeout = 3000) public void test_4() throws java.lang.Exception { int result = java_programs.BITCOUNT.bitcount((int)14); org.junit.Assert.assertEquals( (int) 3, result); }",
-            "@org.junit.Test(timeout = 3000) public void test_5() throws java.lang.Exception { int result = java_programs.BITCOUNT.bitcount((int)27); org.junit.Assert.assertEquals( (int) 4, result); }",
-            "@org.junit.Test(timeout = 3000) public void test_6() throws java.lang.Exception { int result = java_programs.BITCOUNT.bitcount((int)834); org.junit.Assert.assertEquals( (int) 4, result); }",
-            "@org.junit.Test(timeout = 3000) public void test_7() throws java.lang.Exception { int result = java_programs.BITCOUNT.bitcount((int)254); org.junit.Assert.assertEquals( (int) 7, result); }",
-            "@org.junit.Test(timeout = 3000) public void test_8() throws java.lang.Exception { int result = java_programs.BITCOUNT.bitcount((int)256); org.junit.Assert.assertEquals( (int) 1, result); }"
-        ],
-        "lnode": "",
-        "localizer_hypothesis": "",
-        "buggy_stmts": [],
-        "localizer_explanations": [],
-        "repair_hypothesis": "",
-        "fix_diff": "",
-        "repairer_explanation": "",
-        "revision": "",
-        "revision_number": 1,
-        "max_revisions": 2,
-        "count": 0,
-    }
+                    }"
+    failed_tests = [
+        "@org.junit.Test(timeout = 3000) public void test_0() throws java.lang.Exception { int result = java_programs.BITCOUNT.bitcount((int)127); org.junit.Assert.assertEquals( (int) 7, result); }",
+        "@org.junit.Test(timeout = 3000) public void test_1() throws java.lang.Exception { int result = java_programs.BITCOUNT.bitcount((int)128); org.junit.Assert.assertEquals( (int) 1, result); }",
+        "@org.junit.Test(timeout = 3000) public void test_2() throws java.lang.Exception { int result = java_programs.BITCOUNT.bitcount((int)3005); org.junit.Assert.assertEquals( (int) 9, result); }",
+        "@org.junit.Test(timeout = 3000) public void test_3() throws java.lang.Exception { int result = java_programs.BITCOUNT.bitcount((int)13); org.junit.Assert.assertEquals( (int) 3, result); }",
+        "@org.junit.Test(timeout = 3000) public void test_4() throws java.lang.Exception { int result = java_programs.BITCOUNT.bitcount((int)14); org.junit.Assert.assertEquals( (int) 3, result); }",
+        "@org.junit.Test(timeout = 3000) public void test_5() throws java.lang.Exception { int result = java_programs.BITCOUNT.bitcount((int)27); org.junit.Assert.assertEquals( (int) 4, result); }",
+        "@org.junit.Test(timeout = 3000) public void test_6() throws java.lang.Exception { int result = java_programs.BITCOUNT.bitcount((int)834); org.junit.Assert.assertEquals( (int) 4, result); }",
+        "@org.junit.Test(timeout = 3000) public void test_7() throws java.lang.Exception { int result = java_programs.BITCOUNT.bitcount((int)254); org.junit.Assert.assertEquals( (int) 7, result); }",
+        "@org.junit.Test(timeout = 3000) public void test_8() throws java.lang.Exception { int result = java_programs.BITCOUNT.bitcount((int)256); org.junit.Assert.assertEquals( (int) 1, result); }"
+    ]
+    config = initial_state(buggy_program, failed_tests)
     thread = {"configurable":{"thread_id": 1}}
     agent = MultiAgentAPR()
     
@@ -0,0 +1,202 @@
+import json
+import time
+import sqlite3
+import threading
+from typing import Dict, List
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    run_id TEXT,
+    example_id TEXT,
+    program TEXT,
+    model TEXT,
+    config TEXT,
+    outcome TEXT,
+    fixed INTEGER,
+    revisions INTEGER,
+    prompt_tokens INTEGER,
+    completion_tokens INTEGER,
+    cached_tokens INTEGER,
+    llm_latency REAL,
+    latency REAL,
+    error TEXT,
+    created_at REAL
+);
+CREATE INDEX IF NOT EXISTS runs_program ON runs (program);
+CREATE INDEX IF NOT EXISTS runs_model ON runs (model);
+CREATE INDEX IF NOT EXISTS runs_run_id ON runs (run_id);
+CREATE INDEX IF NOT EXISTS runs_outcome ON runs (outcome);
+CREATE TABLE IF NOT EXISTS patches (
+    run INTEGER REFERENCES runs (id),
+    revision INTEGER,
+    patch TEXT,
+    explanation TEXT,
+    outcome TEXT,
+    passed INTEGER,
+    total INTEGER,
+    fingerprint TEXT
+);
+CREATE INDEX IF NOT EXISTS patches_run ON patches (run);
+CREATE TABLE IF NOT EXISTS node_metrics (
+    run INTEGER REFERENCES runs (id),
+    node TEXT,
+    step INTEGER,
+    wall_time REAL,
+    llm_latency REAL,
+    llm_calls INTEGER,
+    prompt_tokens INTEGER,
+    completion_tokens INTEGER,
+    cached_tokens INTEGER,
+    queue_wait REAL,
+    retries INTEGER,
+    cache_hits INTEGER,
+    errors INTEGER
+);
+CREATE INDEX IF NOT EXISTS node_metrics_run ON node_metrics (run, node);
+"""
+
+NODE_FIELDS = ["node", "step", "wall_time", "llm_latency", "llm_calls", "prompt_tokens", "completion_tokens",
+               "cached_tokens", "queue_wait", "retries", "cache_hits", "errors"]
+
+# columns that may be used to filter or group the analytics queries
+FILTERS = ["run_id", "program", "model", "outcome", "example_id"]
+
+
+def run_summary(values: Dict) -> Dict:
+    """Patch, revisions, token and latency totals of a finished repair thread"""
+    metrics = values.get("metrics", [])
+    return {
+        "patch": values["fix_diff"],
+        "explanation": values["repairer_explanation"],
+        "revisions": values["revision_number"] - 1,
+        "prompt_tokens": sum(m["prompt_tokens"] for m in metrics),
+        "completion_tokens": sum(m["completion_tokens"] for m in metrics),
+        "cached_tokens": sum(m["cached_tokens"] for m in metrics),
+        "llm_latency": round(sum(m["llm_latency"] for m in metrics), 4),
+        "queue_wait": round(sum(m.get("queue_wait", 0) for m in metrics), 4),
+        "saved_tokens": sum(m.get("saved_tokens", 0) for m in metrics),
+        "metrics": metrics,
+    }
+
+
+def thread_patches(graph, thread) -> List[Dict]:
+    """Every patch proposed in a thread, oldest first"""
+    patches = []
+    for state in graph.get_state_history(thread):
+        writes = state.metadata.get("writes") or {}
+        for node in ("repairer", "sweeper"):
+            if isinstance(writes.get(node), dict) and writes[node].get("fix_diff"):
+                patches.append({
+                    "revision": state.values["revision_number"] - 1,
+                    "patch": writes[node]["fix_diff"],
+                    "explanation": writes[node].get("repairer_explanation", ""),
+                })
+    return patches[::-1]
+
+
+class ResultsStore():
+    """SQLite store of repair runs, their patches and per node metrics"""
+    def __init__(self, path: str = "results.sqlite"):
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript(SCHEMA)
+        self.conn.commit()
+
+    def record_run(self, result: Dict, run_id: str, model: str = None, config: Dict = None,
+                   validated: bool = False) -> int:
+        """Store one batch runner style result, returns the row id of the run.
+        validated tells the run was meant to be tested, a run that errored
+        before its verdict then counts as not fixed instead of unvalidated"""
+        validation = result.get("validation") or {}
+        outcome = validation.get("outcome") or ("error" if result.get("error") else None)
+        fixed = int(outcome == "plausible") if validation or validated else None
+        with self.lock:
+            cursor = self.conn.execute(
+                "INSERT INTO runs (run_id, example_id, program, model, config, outcome, fixed, revisions, "
+                "prompt_tokens, completion_tokens, cached_tokens, llm_latency, latency, error, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (run_id, result.get("id"), result.get("program"), model, json.dumps(config or {}), outcome, fixed,
+                 result.get("revisions"), result.get("prompt_tokens"), result.get("completion_tokens"),
+                 result.get("cached_tokens"), result.get("llm_latency"), result.get("latency"), result.get("error"),
+                 time.time()))
+            run = cursor.lastrowid
+            patches = result.get("patches") or ([{"revision": result.get("revisions"), "patch": result.get("patch"),
+                                                  "explanation": result.get("explanation")}]
+                                                if result.get("patch") else [])
+            for patch in patches:
+                # beam candidates carry their own verdict, otherwise only the final patch was validated
+                verdict = patch.get("validation")
+                if verdict is None:
+                    verdict = validation if patch.get("patch") == result.get("patch") else {}
+                self.conn.execute(
+                    "INSERT INTO patches VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    (run, patch.get("revision"), patch.get("patch"), patch.get("explanation"), verdict.get("outcome"),
+                     verdict.get("passed"), verdict.get("total"), verdict.get("fingerprint")))
+            self.conn.executemany(
+                f"INSERT INTO node_metrics VALUES (?, {', '.join('?' for _ in NODE_FIELDS)})",
+                [(run, *[m.get(key) for key in NODE_FIELDS]) for m in result.get("metrics", [])])
+            self.conn.commit()
+        return run
+
+    def _query(self, sql: str, params: List) -> List:
+        with self.lock:
+            return self.conn.execute(sql, params).fetchall()
+
+    def _where(self, filters: Dict):
+        unknown = set(filters) - set(FILTERS)
+        if unknown:
+            raise ValueError(f"Cannot filter runs by {unknown}, expected one of {FILTERS}")
+        clauses = [f"{key} = ?" for key in filters]
+        return (" AND " + " AND ".join(clauses)) if clauses else "", list(filters.values())
+
+    def pass_rate(self, **filters) -> float:
+        """Share of validated runs whose final patch passes every test"""
+        where, params = self._where(filters)
+        row = self._query(f"SELECT AVG(fixed) FROM runs WHERE fixed IS NOT NULL{where}", params)[0]
+        return row[0] or 0.0
+
+    def mean_time_to_fix(self, **filters) -> float:
+        """Mean wall time in seconds of the runs that fixed their bug"""
+        where, params = self._where(filters)
+        row = self._query(f"SELECT AVG(latency) FROM runs WHERE fixed = 1{where}", params)[0]
+        return row[0] or 0.0
+
+    def cost_per_fixed_bug(self, prompt_price: float, completion_price: float, cached_price: float = None,
+                           **filters) -> float:
+        """Spend over all matching runs divided by the bugs fixed, prices per
+        million tokens. Cached prompt tokens are billed at cached_price if given"""
+        cached_price = prompt_price if cached_price is None else cached_price
+        where, params = self._where(filters)
+        row = self._query(
+            "SELECT SUM(prompt_tokens - cached_tokens), SUM(cached_tokens), SUM(completion_tokens), SUM(fixed) "
+            f"FROM runs WHERE 1 = 1{where}", params)[0]
+        prompt, cached, completion, fixed = [value or 0 for value in row]
+        cost = (prompt * prompt_price + cached * cached_price + completion * completion_price) / 1e6
+        return cost / fixed if fixed else float("inf")
+
+    def compare(self, group_by: str = "run_id", **filters) -> List[Dict]:
+        """Pass rate, time to fix, tokens and revisions per configuration"""
+        if group_by not in FILTERS:
+            raise ValueError(f"Cannot group runs by {group_by}, expected one of {FILTERS}")
+        where, params = self._where(filters)
+        rows = self._query(
+            f"SELECT {group_by}, COUNT(*), SUM(fixed), AVG(fixed), "
+            "AVG(CASE WHEN fixed = 1 THEN latency END), AVG(prompt_tokens + completion_tokens), AVG(revisions) "
+            f"FROM runs WHERE 1 = 1{where} GROUP BY {group_by} ORDER BY {group_by}", params)
+        columns = [group_by, "runs", "fixed", "pass_rate", "mean_time_to_fix", "mean_tokens", "mean_revisions"]
+        return [dict(zip(columns, row)) for row in rows]
+
+    def node_latency(self, **filters) -> List[Dict]:
+        """Mean wall time, model latency and tokens per node"""
+        where, params = self._where(filters)
+        rows = self._query(
+            "SELECT node, COUNT(*), AVG(node_metrics.wall_time), AVG(node_metrics.llm_latency), "
+            "AVG(node_metrics.prompt_tokens), AVG(node_metrics.completion_tokens) "
+            f"FROM node_metrics JOIN runs ON runs.id = node_metrics.run WHERE 1 = 1{where} GROUP BY node", params)
+        columns = ["node", "calls", "wall_time", "llm_latency", "prompt_tokens", "completion_tokens"]
+        return [dict(zip(columns, row)) for row in rows]
+
+    def close(self):
+        self.conn.close()
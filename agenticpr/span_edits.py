@@ -0,0 +1,72 @@
+import difflib
+from typing import List, Tuple
+
+from agenticpr.validation import PatchError, apply_patch
+from agenticpr.localizer_ensemble import normalize_statement
+from util.java_source import extract_structure
+
+
+def focus_ranges(program: str, statements: List[str]) -> List[Tuple[int, int]]:
+    """1-based inclusive line ranges of the methods holding the given
+    statements, the whole program if none of them can be found"""
+    lines = program.splitlines()
+    wanted = [normalize_statement(s) for s in statements if normalize_statement(s)]
+    hits = [n for n, line in enumerate(lines, 1)
+            if any(w and w in normalize_statement(line) for w in wanted)]
+    try:
+        methods = extract_structure(program).methods
+    except ValueError:
+        methods = []
+    ranges = set()
+    for n in hits:
+        around = [m for m in methods if m["start"] <= n <= m["stop"]]
+        if around:
+            method = min(around, key=lambda m: m["stop"] - m["start"])
+            ranges.add((method["start"], method["stop"]))
+    return sorted(ranges) or [(1, len(lines))]
+
+
+def numbered(program: str, ranges: List[Tuple[int, int]] = None) -> str:
+    """Program lines prefixed with their line number, only the given ranges if any"""
+    lines = program.splitlines()
+    ranges = ranges or [(1, len(lines))]
+    blocks = ["\n".join(f"{n}: {lines[n - 1]}" for n in range(start, stop + 1)) for start, stop in ranges]
+    return "\n...\n".join(blocks)
+
+
+def apply_edits(program: str, edits: List) -> str:
+    """Apply span edits (start, end, replacement), line numbers refer to the
+    original program. end = start - 1 inserts before start, an empty
+    replacement deletes the lines"""
+    lines = program.splitlines()
+    spans = sorted(edits, key=lambda e: (e.start, e.end))
+    for edit in spans:
+        if not 1 <= edit.start <= len(lines) + 1 or not edit.start - 1 <= edit.end <= len(lines):
+            raise PatchError(f"Edit of lines {edit.start}-{edit.end} is outside the program (1-{len(lines)})")
+    for previous, edit in zip(spans, spans[1:]):
+        if edit.start <= previous.end:
+            raise PatchError(f"Edits of lines {previous.start}-{previous.end} and {edit.start}-{edit.end} overlap")
+    for edit in reversed(spans):  # bottom up, so earlier line numbers stay valid
+        replacement = edit.replacement.splitlines() if edit.replacement else []
+        lines[edit.start - 1:edit.end] = replacement
+    return "\n".join(lines) + ("\n" if program.endswith("\n") else "")
+
+
+def unified_diff(program: str, patched: str) -> str:
+    """Diff of the edited program that apply_patch places back exactly. One
+    line of context unless that is ambiguous or blank, then more, up to the
+    whole program"""
+    for context in (1, 3, len(program.splitlines())):
+        diff = "".join(f"{line}\n" for line in difflib.unified_diff(
+            program.splitlines(), patched.splitlines(), fromfile="buggy", tofile="fixed", n=context, lineterm=""))
+        try:
+            if apply_patch(program, diff) == patched:
+                break
+        except PatchError:
+            continue
+    return diff
+
+
+def format_edits(edits: List) -> str:
+    """Edits as text, shown back to the model when they cannot be applied"""
+    return "\n".join(f"lines {e.start}-{e.end}:\n{e.replacement}" for e in edits)
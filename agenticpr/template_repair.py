@@ -0,0 +1,121 @@
+import re
+import difflib
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, List, Optional
+from antlr4 import ParseTreeWalker, Token
+
+from util.JavaLexer import JavaLexer
+from util.java_source import parse_java, extract_structure
+from agenticpr.fingerprint import LocalNames, patch_fingerprint
+from agenticpr.validation import check_syntax
+
+JAVA_KEYWORDS = {"if", "for", "while", "switch", "catch", "return", "new", "synchronized", "super", "this"}
+
+# one token replacements, tried in this order
+OPERATOR_SWAPS = {
+    "<": ["<="], "<=": ["<"], ">": [">="], ">=": [">"],
+    "==": ["!="], "!=": ["=="],
+    "&&": ["||"], "||": ["&&"],
+    "+": ["-"], "-": ["+"], "*": ["/"], "/": ["*"], "%": ["/"],
+    "&": ["|", "^"], "|": ["&", "^"], "^": ["&", "|"],
+    "++": ["--"], "--": ["++"], "+=": ["-="], "-=": ["+="],
+    "true": ["false"], "false": ["true"],
+}
+
+
+class Mutant():
+    def __init__(self, program: str, patched: str, line: int, before: str, after: str, kind: str):
+        self.patched = patched
+        self.line = line
+        self.before = before
+        self.after = after
+        self.kind = kind
+        # for display, the mutant is validated as patched source
+        self.diff = "".join(difflib.unified_diff(program.splitlines(True), patched.splitlines(True),
+                                                 fromfile="buggy", tofile="fixed", n=1))
+
+    def explanation(self) -> str:
+        return f"Template repair ({self.kind}): replaced '{self.before}' with '{self.after}' on line {self.line}"
+
+
+class TemplateRepair():
+    """Cheap pre-LLM repair for one token bugs (operator swaps, off by one
+    literals, wrong variable). Mutates the methods called by the failing tests,
+    drops mutants that do not parse or are equivalent to another one, and runs
+    the tests in parallel on the max_runs closest to the suspicious lines"""
+    def __init__(self, validator, workers: int = 4, max_mutants: int = 150, max_runs: int = 15):
+        self.validator = validator
+        self.workers = workers
+        self.max_mutants = max_mutants
+        # every run is a gradle build, the sweep has to stay in seconds
+        self.max_runs = max_runs
+
+    def target_methods(self, program: str, failed_tests: List[str]) -> List[Dict]:
+        called = {name for test in failed_tests for name in re.findall(r"([A-Za-z_$][\w$]*)\s*\(", test)}
+        methods = extract_structure(program).methods
+        return [m for m in methods if m["name"] in called - JAVA_KEYWORDS] or methods
+
+    def mutants(self, program: str, failed_tests: List[str]) -> List[Mutant]:
+        tree, parser = parse_java(program)
+        if parser.getNumberOfSyntaxErrors() > 0:
+            return []
+        tokens = [t for t in parser.getTokenStream().tokens if t.type != Token.EOF]
+        names = LocalNames()
+        ParseTreeWalker().walk(names, tree)
+        lines = {(m["start"], m["stop"]) for m in self.target_methods(program, failed_tests)}
+
+        def in_target(token):
+            return any(start <= token.line <= stop for start, stop in lines)
+
+        def locals_at(index):
+            scopes = [s for s in names.scopes if s[0] <= index <= s[1]]
+            return min(scopes, key=lambda s: s[1] - s[0])[2] if scopes else []
+
+        operators, literals, variables = [], [], []
+        for i, token in enumerate(tokens):
+            if token.channel != Token.DEFAULT_CHANNEL or not in_target(token):
+                continue
+            text = token.text
+            if text in OPERATOR_SWAPS:
+                operators += [(i, replacement, "operator swap") for replacement in OPERATOR_SWAPS[text]]
+            elif token.type == JavaLexer.IntegerLiteral and text.isdigit():
+                literals += [(i, str(int(text) + delta), "off by one") for delta in (1, -1) if int(text) + delta >= 0]
+            elif token.type == JavaLexer.Identifier and i not in names.declarations:
+                declared = locals_at(i)
+                if text in declared:
+                    variables += [(i, other, "variable swap") for other in declared if other != text]
+
+        mutants = []
+        for i, replacement, kind in (operators + literals + variables)[:self.max_mutants]:
+            token = tokens[i]
+            patched = program[:token.start] + replacement + program[token.stop + 1:]
+            if not check_syntax(program, patched):
+                mutants.append(Mutant(program, patched, token.line, token.text, replacement, kind))
+        return mutants
+
+    def rank(self, program: str, mutants: List[Mutant], suspicious_lines: List[int] = None) -> List[Mutant]:
+        """Mutants worth a test run: one per fingerprint, none equivalent to the
+        program, closest to the suspicious lines first, at most max_runs"""
+        seen, ranked = {patch_fingerprint(program)}, []
+        for mutant in mutants:
+            fingerprint = patch_fingerprint(mutant.patched)
+            if fingerprint not in seen:
+                seen.add(fingerprint)
+                ranked.append(mutant)
+        if suspicious_lines:
+            ranked.sort(key=lambda m: min(abs(m.line - line) for line in suspicious_lines))
+        return ranked[:self.max_runs]
+
+    def sweep(self, program: str, failed_tests: List[str], suspicious_lines: List[int] = None) -> Optional[Mutant]:
+        """First mutant that passes every test, or None"""
+        mutants = self.rank(program, self.mutants(program, failed_tests), suspicious_lines)
+        if not mutants:
+            return None
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            futures = {executor.submit(self.validator.validate_patched, program, m.patched): m for m in mutants}
+            for future in as_completed(futures):
+                if future.result().get("outcome") == "plausible":
+                    for pending in futures:
+                        pending.cancel()
+                    return futures[future]
+        return None
@@ -0,0 +1,129 @@
+import re
+import difflib
+from functools import lru_cache
+from typing import Dict, List, Tuple
+
+from util.java_source import TEST_HEADER
+from agenticpr.context_slicer import count_tokens
+
+TOKEN = re.compile(r'"(?:\\.|[^"\\])*"|\'(?:\\.|[^\'\\])*\'|\d[\w.]*|[A-Za-z_$][\w$]*'
+                   r'|>>>=|<<=|>>=|\+\+|--|&&|\|\||[=!<>+\-*/%&|^]=|->|::|\S')
+WORD = re.compile(r"[\w$]")
+LITERAL = re.compile(r'^(\d[\w.]*|".*"|\'.*\'|,)$')
+
+
+def tokenize(test: str) -> List[str]:
+    header = TEST_HEADER.match(test)
+    body = test[header.end():].rstrip() if header else test
+    if header and body.endswith("}"):
+        body = body[:-1]
+    return TOKEN.findall(body)
+
+
+def render(tokens: List[str]) -> str:
+    """Tokens joined with a space only where two words would otherwise merge"""
+    text = ""
+    for token in tokens:
+        if text and WORD.match(text[-1]) and WORD.match(token[0]):
+            text += " "
+        text += token
+    return text
+
+
+def _holes(template: List[str], tests: List[List[str]]) -> List[Tuple[int, int]]:
+    """Template ranges that differ in at least one test. Ranges are merged when
+    they touch or are separated only by literals, so a differing array or list
+    argument becomes one value instead of one per element"""
+    ranges = []
+    for tokens in tests:
+        matcher = difflib.SequenceMatcher(None, template, tokens, autojunk=False)
+        ranges += [(i1, i2) for op, i1, i2, _, _ in matcher.get_opcodes() if op != "equal"]
+    merged = []
+    for start, stop in sorted(ranges):
+        if merged and all(LITERAL.match(token) for token in template[merged[-1][1]:start]):
+            merged[-1] = (merged[-1][0], max(merged[-1][1], stop))
+        else:
+            merged.append((start, stop))
+    return merged
+
+
+def _fill(template: List[str], tokens: List[str], holes: List[Tuple[int, int]]) -> List[str]:
+    """Text of tokens at each hole of the template"""
+    opcodes = difflib.SequenceMatcher(None, template, tokens, autojunk=False).get_opcodes()
+
+    def position(i, end):
+        found = None
+        for op, i1, i2, j1, j2 in opcodes:
+            if i1 <= i <= i2:
+                found = j1 + (i - i1) if op == "equal" else (j2 if end and i == i2 else j1)
+                if not end:
+                    return found
+        return len(tokens) if found is None else found
+
+    return [render(tokens[position(start, False):position(stop, True)]) for start, stop in holes]
+
+
+class TestSerializer():
+    """Compact rendering of failing junit tests for the prompts.
+
+    Tests whose token sequences differ only in a few places (QuixBugs tests
+    usually differ in the input and expected value) are written once as a call
+    template with $1, $2, ... placeholders followed by one row of values per
+    test. Formatting whitespace and the junit method boilerplate are dropped"""
+    def __init__(self, similarity=0.6, max_holes=4, model="gpt-4o"):
+        self.similarity = similarity
+        self.max_holes = max_holes
+        self.model = model
+
+    def groups(self, tests: List[List[str]]) -> List[List[int]]:
+        groups = []
+        for i, tokens in enumerate(tests):
+            for group in groups:
+                template = tests[group[0]]
+                if difflib.SequenceMatcher(None, template, tokens, autojunk=False).ratio() >= self.similarity:
+                    group.append(i)
+                    break
+            else:
+                groups.append([i])
+        return groups
+
+    def render_group(self, tests: List[List[str]], group: List[int]) -> str:
+        verbatim = "".join(f"#{i} {render(tests[i])}\n" for i in group)
+        if len(group) < 2:
+            return verbatim
+        template = tests[group[0]]
+        holes = _holes(template, [tests[i] for i in group[1:]])
+        if not holes or len(holes) > self.max_holes:
+            return verbatim
+        pattern, last = [], 0
+        for n, (start, stop) in enumerate(holes, 1):
+            pattern += template[last:start] + [f"${n}"]
+            last = stop
+        pattern += template[last:]
+        rows = "".join(f"#{i} {' | '.join(_fill(template, tests[i], holes))}\n" for i in group)
+        compact = f"{render(pattern)}\n{rows}"
+        return compact if len(compact) < len(verbatim) else verbatim
+
+    def serialize(self, failed_tests: List[str]) -> str:
+        tests = [tokenize(test) for test in failed_tests]
+        return "".join(self.render_group(tests, group) for group in self.groups(tests))
+
+    def savings(self, failed_tests: List[str]) -> Dict:
+        """Prompt tokens of the verbatim and the compact test listing"""
+        verbatim = count_tokens(verbatim_tests(failed_tests), self.model)
+        compact = count_tokens(self.serialize(failed_tests), self.model)
+        return {"verbatim_tokens": verbatim, "compact_tokens": compact, "saved_tokens": verbatim - compact}
+
+
+def verbatim_tests(failed_tests: List[str]) -> str:
+    return "".join(f"#{i}\n{test}\n------\n" for i, test in enumerate(failed_tests))
+
+
+@lru_cache(maxsize=256)
+def _serialize(failed_tests: Tuple[str, ...]) -> str:
+    return TestSerializer().serialize(list(failed_tests))
+
+
+def compact_tests(failed_tests: List[str]) -> str:
+    """Cached, every node of a thread renders the same tests"""
+    return _serialize(tuple(failed_tests))
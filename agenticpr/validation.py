@@ -0,0 +1,219 @@
+import os
+import re
+import difflib
+import subprocess
+from typing import Dict, List, Optional, Tuple
+
+from util.java_source import extract_structure, syntax_errors
+from agenticpr.fingerprint import VerdictCache, patch_fingerprint
+from agenticpr.workspace import WorkspacePool
+
+QUIXBUG_PATH = os.path.join(os.environ.get("PYTHONPATH", "."), "benchmarks/QuixBugs")
+HUNK_HEADER = re.compile(r"^@@\s*-(\d+)")
+
+
+class PatchError(ValueError):
+    pass
+
+
+def program_name(program: str) -> str:
+    match = re.search(r"\bclass\s+(\w+)", program)
+    if not match:
+        raise ValueError("No class declaration found in the program")
+    return match.group(1)
+
+
+def _parse_hunks(diff: str) -> List[Tuple[Optional[int], List[str]]]:
+    """(0-based start line from the @@ header or None, hunk lines) per hunk"""
+    lines = [line for line in diff.strip("\n").splitlines() if not line.startswith("```")]
+    hunks, current = [], None
+    for line in lines:
+        if line.startswith("---") or line.startswith("+++") or line.startswith("diff "):
+            continue
+        if line.startswith("@@"):
+            header = HUNK_HEADER.match(line)
+            current = []
+            hunks.append((int(header.group(1)) - 1 if header else None, current))
+            continue
+        if current is None:  # diff without hunk headers
+            current = []
+            hunks.append((None, current))
+        current.append(line)
+    return [(start, hunk) for start, hunk in hunks if any(line[:1] in "+-" for line in hunk)]
+
+
+def _indent(line: str) -> int:
+    return len(line) - len(line.lstrip())
+
+
+def _locate(stripped: List[str], target: List[str], start: Optional[int]) -> Optional[int]:
+    """Position of target in the program lines. When it occurs more than once
+    the occurrence nearest the hunk header line wins, a tie or a hunk without
+    line numbers is ambiguous"""
+    positions = [i for i in range(len(stripped) - len(target) + 1) if stripped[i:i + len(target)] == target]
+    if len(positions) <= 1:
+        return positions[0] if positions else None
+    if start is None:
+        raise PatchError(f"Hunk matches {len(positions)} places and has no line numbers: {target[:3]}")
+    positions.sort(key=lambda i: abs(i - start))
+    if abs(positions[0] - start) == abs(positions[1] - start):
+        raise PatchError(f"Hunk matches lines {positions[0] + 1} and {positions[1] + 1} equally well: {target[:3]}")
+    return positions[0]
+
+
+def apply_patch(program: str, diff: str) -> str:
+    """Apply a unified diff to the program. Hunks are located by their
+    context and removed lines, ignoring indentation, since the line numbers
+    produced by the model are unreliable. The @@ line numbers only choose
+    between several matching places"""
+    lines = program.splitlines()
+    offset = 0  # lines added minus removed by the previous hunks, header numbers refer to the original
+    for start, hunk in _parse_hunks(diff):
+        old, new = [], []  # new holds (old index or None, text)
+        for line in hunk:
+            tag, text = line[:1], line[1:]
+            if tag == "-":
+                old.append(text)
+            elif tag == "+":
+                new.append((None, text))
+            else:
+                new.append((len(old), text))
+                old.append(text)
+        while old and not old[-1].strip() and new and not new[-1][1].strip():
+            old.pop()
+            new.pop()
+        stripped = [line.strip() for line in lines]
+        target = [line.strip() for line in old]
+        position = _locate(stripped, target, None if start is None else start + offset) if old else None
+        if position is None:
+            raise PatchError(f"Hunk does not apply: {old[:3]}")
+        # keep context lines verbatim and shift added lines by the indentation difference
+        anchor = next((i for i, text in enumerate(old) if text.strip()), 0)
+        shift = _indent(lines[position + anchor]) - _indent(old[anchor])
+        replacement = []
+        for index, text in new:
+            if index is not None:
+                replacement.append(lines[position + index])
+            elif shift >= 0:
+                replacement.append(" " * shift + text)
+            else:
+                replacement.append(text[min(-shift, _indent(text)):])
+        lines[position:position + len(old)] = replacement
+        offset += len(replacement) - len(old)
+    return "\n".join(lines) + ("\n" if program.endswith("\n") else "")
+
+
+def changed_members(program: str, patched: str) -> Optional[List[Tuple[int, int]]]:
+    """0-based [start, stop) line ranges of the patched program holding the
+    methods touched by the patch, or None if a change falls outside a method
+    or moves a method boundary, in which case the whole file has to be parsed"""
+    try:
+        methods = extract_structure(program).methods
+    except ValueError:
+        return None
+    old, new = program.splitlines(), patched.splitlines()
+    opcodes = difflib.SequenceMatcher(None, old, new, autojunk=False).get_opcodes()
+    mapping = {}  # old line index -> new line index, for unchanged lines
+    for tag, i1, i2, j1, j2 in opcodes:
+        if tag == "equal":
+            mapping.update(zip(range(i1, i2), range(j1, j2)))
+    members = set()
+    for tag, i1, i2, j1, j2 in opcodes:
+        if tag == "equal":
+            continue
+        # innermost method strictly around the change, header and closing line excluded
+        around = [m for m in methods if m["start"] - 1 < i1 and max(i2, i1 + 1) <= m["stop"] - 1]
+        if not around:
+            return None
+        method = min(around, key=lambda m: m["stop"] - m["start"])
+        start, stop = mapping.get(method["start"] - 1), mapping.get(method["stop"] - 1)
+        if start is None or stop is None:
+            return None
+        members.add((start, stop + 1))
+    return sorted(members)
+
+
+def check_syntax(program: str, patched: str) -> List[Dict]:
+    """Syntax errors of the patched program. Only the changed methods are
+    parsed when possible, the whole file only if that fails or is not possible"""
+    members = changed_members(program, patched)
+    if members is not None:
+        lines = patched.splitlines()
+        if not any(syntax_errors("\n".join(lines[start:stop]), "classBodyDeclaration", start)
+                   for start, stop in members):
+            return []
+    return syntax_errors(patched)
+
+
+def check_patch(program: str, diff: str) -> List[Dict]:
+    """Structured problems of a candidate patch, [] if it applies and parses"""
+    try:
+        patched = apply_patch(program, diff)
+    except PatchError as e:
+        return [{"line": None, "column": None, "token": None, "message": f"patch does not apply: {e}"}]
+    return check_syntax(program, patched)
+
+
+def format_errors(errors: List[Dict]) -> str:
+    return "\n".join(f"line {e['line']}:{e['column']} {e['message']}" if e["line"] is not None else e["message"]
+                     for e in errors)
+
+
+class TestValidator():
+    """Runs the QuixBugs junit tests of one program against a patched version.
+    Verdicts are cached by patch fingerprint, so equivalent candidates are tested once"""
+    def __init__(self, quixbugs_path=QUIXBUG_PATH, timeout=300, cache=None, workers=4):
+        self.quixbugs_path = quixbugs_path
+        self.timeout = timeout
+        self.cache = cache if cache is not None else VerdictCache()
+        # at most `workers` gradle runs at once, each in its own hardlinked copy of the project
+        self.workspaces = WorkspacePool(quixbugs_path, slots=workers)
+
+    def count_tests(self, name: str) -> int:
+        test_file = os.path.join(self.quixbugs_path, "java_testcases", "junit", f"{name}_TEST.java")
+        with open(test_file) as f:
+            return len(re.findall(r"@org\.junit\.Test", f.read()))
+
+    def test_names(self, name: str) -> List[str]:
+        test_file = os.path.join(self.quixbugs_path, "java_testcases", "junit", f"{name}_TEST.java")
+        with open(test_file) as f:
+            return re.findall(r"@org\.junit\.Test[^;{]*?void\s+(\w+)\s*\(", f.read())
+
+    def run_tests(self, project_dir: str, name: str):
+        command = ["gradle", "test", "--tests", f"{name}_TEST", "--console=plain"]
+        try:
+            result = subprocess.run(command, cwd=project_dir, capture_output=True, text=True, timeout=self.timeout)
+        except subprocess.TimeoutExpired:
+            return {"outcome": "timeout", "failed_tests": [], "passed": 0}
+        failed = re.findall(r"> (\S+) FAILED", result.stdout, re.MULTILINE)
+        total = self.count_tests(name)
+        if result.returncode != 0 and not failed:
+            return {"outcome": "compile_error", "failed_tests": [], "passed": 0, "log": result.stdout[-2000:]}
+        return {"outcome": "plausible" if not failed else "failing", "failed_tests": failed,
+                "passed": total - len(failed), "total": total}
+
+    def validate(self, program: str, fix_diff: str) -> dict:
+        try:
+            patched = apply_patch(program, fix_diff)
+        except PatchError as e:
+            return {"outcome": "apply_failed", "failed_tests": [], "passed": 0, "error": str(e)}
+        return self.validate_patched(program, patched)
+
+    def validate_patched(self, program: str, patched: str) -> dict:
+        """Verdict of an already patched program, for candidates produced as
+        source rather than as a diff that would have to be placed again"""
+        errors = check_syntax(program, patched)
+        if errors:  # no need to start gradle for a program that does not parse
+            return {"outcome": "syntax_error", "failed_tests": [], "passed": 0, "errors": errors}
+        fingerprint = patch_fingerprint(patched)
+        verdict = self.cache.get_or_run(fingerprint, lambda: self.run_patched(patched))
+        return {**verdict, "fingerprint": fingerprint}
+
+    def run_patched(self, patched: str) -> dict:
+        name = program_name(patched)
+        with self.workspaces.acquire() as workspace:
+            workspace.write(os.path.join("java_programs", f"{name}.java"), patched)
+            return self.run_tests(workspace.path, name)
+
+    def close(self):
+        self.workspaces.close()
@@ -0,0 +1,111 @@
+import os
+import queue
+import shutil
+import tempfile
+import threading
+import weakref
+from contextlib import contextmanager
+
+IGNORED = ("build", ".gradle", "target", ".git")
+
+
+def link_tree(source: str, target: str, ignore=IGNORED):
+    """Mirror source into target with hardlinks, so a slot costs directory
+    entries instead of file copies. Falls back to copying across devices"""
+    for directory, dirs, files in os.walk(source):
+        dirs[:] = [d for d in dirs if d not in ignore]
+        destination = os.path.join(target, os.path.relpath(directory, source))
+        os.makedirs(destination, exist_ok=True)
+        for name in files:
+            src, dst = os.path.join(directory, name), os.path.join(destination, name)
+            try:
+                os.link(src, dst)
+            except OSError:
+                shutil.copy2(src, dst)
+
+
+class Workspace():
+    """One slot of a WorkspacePool. Files written through it replace the link,
+    the shared source tree is never modified"""
+    def __init__(self, source: str, path: str):
+        self.source = source
+        self.path = path
+        self.dirty = set()
+
+    def write(self, relative_path: str, content: str):
+        path = os.path.join(self.path, relative_path)
+        if os.path.exists(path):
+            os.unlink(path)  # writing in place would change every linked copy
+        with open(path, "w") as f:
+            f.write(content)
+        self.dirty.add(relative_path)
+
+    def reset(self):
+        """Link the patched files back to the source for the next user"""
+        for relative_path in self.dirty:
+            path = os.path.join(self.path, relative_path)
+            if os.path.exists(path):
+                os.unlink(path)
+            source = os.path.join(self.source, relative_path)
+            if os.path.exists(source):
+                try:
+                    os.link(source, path)
+                except OSError:
+                    shutil.copy2(source, path)
+        self.dirty = set()
+
+
+class WorkspacePool():
+    """Bounded pool of reusable working copies of a project tree.
+
+    Slots are hardlinked mirrors created on first use. Only the files a
+    candidate patches are materialized, and they are relinked when the slot
+    is released, so build outputs stay warm for the next candidate"""
+    def __init__(self, source: str, slots: int = 4, root: str = None, ignore=IGNORED):
+        self.source = source
+        self.root = root
+        self.ignore = ignore
+        self.lock = threading.Lock()
+        self.created = {}
+        self.cleanup = None
+        self.free = queue.Queue()
+        for slot in range(slots):
+            self.free.put(slot)
+
+    def _slot(self, slot: int) -> Workspace:
+        with self.lock:
+            if self.root is None:
+                self.root = tempfile.mkdtemp(prefix="apr_workspaces_")
+                # removed at exit or when the pool is collected, e.g. the GUI never calls close()
+                self.cleanup = weakref.finalize(self, shutil.rmtree, self.root, True)
+            workspace = self.created.get(slot)
+        if workspace is None:
+            path = os.path.join(self.root, f"{os.path.basename(os.path.normpath(self.source))}_{slot}")
+            link_tree(self.source, path, self.ignore)
+            workspace = Workspace(self.source, path)
+            with self.lock:
+                self.created[slot] = workspace
+        return workspace
+
+    @contextmanager
+    def acquire(self, timeout: float = None):
+        """Borrow a slot, blocking while all of them are in use"""
+        slot = self.free.get(timeout=timeout)
+        try:
+            workspace = self._slot(slot)
+            try:
+                yield workspace
+            finally:
+                workspace.reset()
+        finally:
+            self.free.put(slot)
+
+    def close(self):
+        with self.lock:
+            if self.root is not None:
+                shutil.rmtree(self.root, ignore_errors=True)
+            if self.cleanup is not None:
+                self.cleanup.detach()
+            self.root = None
+            self.cleanup = None
+            self.created = {}
@@ -1,21 +1,30 @@
+import os
 import io
 from dotenv import load_dotenv
 from PIL import Image
 import gradio as gr
+import pandas as pd
 from agenticwriter.multi_agent_writer import MultiAgentWriter
+from util.metrics import METRIC_FIELDS, summarize, export_metrics
+from util.checkpointer import existing_threads
+from util.streaming import stream_until_interrupt
+from util.speculation import Speculator
 
 _ = load_dotenv()
 
 class WriterGUI():
-    def __init__(self, graph, share=False):
+    def __init__(self, graph, share=False, speculate=False):
         self.graph = graph
         self.share = share
+        # opt-in: run the next node in the background while the user reviews the last one
+        self.speculator = Speculator(graph) if speculate else None
         self.partial_message = ""
         self.response = {}
         self.max_iterations = 10
-        self.iterations = []
-        self.threads = []
-        self.thread_id = -1
+        # continue numbering after threads persisted by a previous run
+        self.threads = sorted(int(t) for t in existing_threads(graph.checkpointer) if str(t).isdigit())
+        self.thread_id = self.threads[-1] if self.threads else -1
+        self.iterations = [0] * (self.thread_id + 1)
         self.thread = {"configurable": {"thread_id": str(self.thread_id)}}
         #self.sdisps = {} #global    
         self.demo = self.create_interface()
@@ -25,7 +34,7 @@ class WriterGUI():
             self.iterations.append(0)
             config = {'task': topic,"max_revisions": 2,"revision_number": 0,
                       'lnode': "", 'planner': "no plan", 'draft': "no draft", 'critique': "no critique", 
-                      'content': ["no content",], 'queries': "no queries", 'count':0}
+                      'content': ["no content",], 'queries': "no queries", 'count':0, 'metrics': []}
             self.thread_id += 1
             self.threads.append(self.thread_id)
         else:
@@ -33,12 +42,26 @@ class WriterGUI():
         
         self.thread = {"configurable": {"thread_id": str(self.thread_id)}}
         while self.iterations[self.thread_id] < self.max_iterations:
-            self.response = self.graph.invoke(config, self.thread)
+            committed = self.speculator.commit(self.thread) if self.speculator and config is None else None
+            if committed is not None:
+                for node, update in committed:
+                    self.partial_message += f"{node}: {update}"
+                    self.partial_message += f"\n------------------\n\n"
+                yield self.partial_message
+            else:
+                live = ""
+                for kind, node, data in stream_until_interrupt(self.graph, config, self.thread):
+                    if kind == "token":
+                        live += data
+                        yield self.partial_message + f"[{node}] {live}"
+                    else:
+                        live = ""
+                        self.partial_message += f"{node}: {data}"
+                        self.partial_message += "\n------------------\n\n"
+                        yield self.partial_message
+            self.response = self.graph.get_state(self.thread).values
             self.iterations[self.thread_id] += 1
-            self.partial_message += str(self.response)
-            self.partial_message += f"\n------------------\n\n"
             lnode,nnode,_,rev,acount = self.get_disp_state()
-            yield self.partial_message, lnode, nnode, self.thread_id, rev, acount
             config = None
             print(f"run_agent:{lnode}")
             if not nnode:  
@@ -46,6 +69,8 @@ class WriterGUI():
                 return
             if lnode in stop_after:
                 print(f"stopping due to stop_after {lnode}")
+                if self.speculator:
+                    self.speculator.speculate(self.thread)
                 return
             else:
                 print(f"Not stopping on lnode {lnode}")
@@ -102,10 +127,13 @@ class WriterGUI():
         return (None)
 
     def copy_state(self, hist_str):
+        if self.speculator:
+            self.speculator.discard(self.thread)
         thread_ts = hist_str.split(":")[-1]
         config = self.find_config(thread_ts)
         state = self.graph.get_state(config)
-        self.graph.update_state(self.thread, state.values, as_node=state.values["lnode"])
+        values = {k: v for k, v in state.values.items() if k != "metrics"}
+        self.graph.update_state(self.thread, values, as_node=state.values["lnode"])
         new_state = self.graph.get_state(self.thread)
         new_thread_ts = new_state.config['configurable']['checkpoint_id']
         tid = new_state.config['configurable']['thread_id']
@@ -125,8 +153,11 @@ class WriterGUI():
         return self.thread_id
         
     def modify_state(self, key, asnode, new_state):
+        if self.speculator:
+            self.speculator.discard(self.thread)
         current_values = self.graph.get_state(self.thread)
         current_values.values[key] = new_state
+        current_values.values.pop("metrics", None)
         self.graph.update_state(self.thread, current_values.values, as_node=asnode)
         return 
     
@@ -134,6 +165,14 @@ class WriterGUI():
         img = Image.open(io.BytesIO(self.graph.get_graph().draw_png()))
         return img
     
+    def get_metrics(self):
+        records = self.graph.get_state(self.thread).values.get("metrics", [])
+        return pd.DataFrame(records, columns=METRIC_FIELDS), pd.DataFrame(summarize(records))
+    
+    def export_thread_metrics(self):
+        records = self.graph.get_state(self.thread).values.get("metrics", [])
+        return export_metrics(records, f"writer_metrics_thread_{self.thread_id}.csv")
+    
     def create_interface(self):
         with gr.Blocks(theme=gr.themes.Origin(spacing_size='sm', text_size='sm')) as app:
             
@@ -272,6 +311,16 @@ class WriterGUI():
                     refresh_btn = gr.Button("Refresh")
                 snapshots = gr.Textbox(label="State Snapshots Summaries")
                 refresh_btn.click(fn=get_snapshots, inputs=None, outputs=snapshots)
+            
+            with gr.Tab("Metrics"):
+                with gr.Row():
+                    refresh_btn = gr.Button("Refresh")
+                    export_btn = gr.Button("Export")
+                summary_df = gr.Dataframe(label="Per Node Summary")
+                metrics_df = gr.Dataframe(label="Node Metrics")
+                export_file = gr.File(label="Exported Metrics")
+                refresh_btn.click(fn=self.get_metrics, inputs=None, outputs=[metrics_df, summary_df])
+                export_btn.click(fn=self.export_thread_metrics, inputs=None, outputs=export_file)
         return app
 
     # def launch(self, share=None):
@@ -282,5 +331,5 @@ class WriterGUI():
 
 if __name__ == "__main__":
     agent = MultiAgentWriter()
-    gui = WriterGUI(agent.graph)
+    gui = WriterGUI(agent.graph, speculate=os.environ.get("SPECULATE", "0") == "1")
     gui.demo.launch(debug=True, show_error=True)
\ No newline at end of file
@@ -1,13 +1,13 @@
-import os
-from typing import List, TypedDict, Annotated
+from typing import List, TypedDict, Annotated, Dict
 import operator
 from dotenv import load_dotenv
 from pydantic import BaseModel
 from langgraph.graph import StateGraph, END
-from langchain_openai import ChatOpenAI
 from langchain_core.messages import AnyMessage, SystemMessage, HumanMessage, AIMessage, ChatMessage
-from langgraph.checkpoint.memory import MemorySaver
-from tavily import TavilyClient
+
+from util.metrics import instrument, usage_handler
+from util.llm import get_chat_model, get_search_client, structured
+from util.checkpointer import get_checkpointer
 
 _ = load_dotenv()
 
@@ -22,18 +22,14 @@ class AgentState(TypedDict):
     revision_number: int
     max_revisions: int
     count: Annotated[int, operator.add]
+    metrics: Annotated[List[Dict], operator.add]
 
 class Queries(BaseModel):
     queries: List[str]
 
 class MultiAgentWriter():
     def __init__(self):
-        self.model = ChatOpenAI(
-            model="gpt-4o",
-            base_url="https://models.inference.ai.azure.com",
-            api_key=os.environ['GITHUB_TOKEN'],
-            temperature=0
-        )
+        self.model = get_chat_model("gpt-4o", temperature=0, callbacks=[usage_handler])
         builder = StateGraph(AgentState)
         self.PLAN_PROMPT = ("You are an expert writer tasked with writing a high level outline of a short 3 paragraph essay. "
                             "Write such an outline for the user provided topic. Give the three main headers of an outline of "
@@ -56,14 +52,14 @@ class MultiAgentWriter():
                                          "Generate a list of search queries that will gather any relevant information. "
                                          "Only generate 2 queries max.")
         
-        self.tavily = TavilyClient(api_key=os.environ['TAVILY_API_KEY'])
+        self.tavily = get_search_client()
         
         
-        builder.add_node("planner", self.plan_node)
-        builder.add_node("generator", self.generate_node)
-        builder.add_node("researcher", self.research_node)
-        builder.add_node("reflector", self.reflector_node)
-        builder.add_node("critiquer", self.critiquer_node)
+        builder.add_node("planner", instrument("writer", "planner", self.plan_node))
+        builder.add_node("generator", instrument("writer", "generator", self.generate_node))
+        builder.add_node("researcher", instrument("writer", "researcher", self.research_node))
+        builder.add_node("reflector", instrument("writer", "reflector", self.reflector_node))
+        builder.add_node("critiquer", instrument("writer", "critiquer", self.critiquer_node))
         
         builder.add_conditional_edges("generator",
                                          self.should_continue,
@@ -75,7 +71,7 @@ class MultiAgentWriter():
         builder.add_edge("critiquer", "generator")
         builder.set_entry_point("planner")
         
-        memory = MemorySaver()
+        memory = get_checkpointer("writer")
         self.graph = builder.compile(
                 checkpointer=memory,
                 interrupt_after=['planner', 'researcher', 'generator', 'reflector', 'critiquer']
@@ -93,7 +89,7 @@ class MultiAgentWriter():
                 "count": 1}
     
     def research_node(self, state:AgentState):
-        queries = self.model.with_structured_output(Queries).invoke([
+        queries = structured(self.model, Queries).invoke([
             SystemMessage(content=self.RESEARCH_PLAN_PROMPT),
             HumanMessage(content=state["task"])
             ])
@@ -132,7 +128,7 @@ class MultiAgentWriter():
                 "count": 1}
             
     def critiquer_node(self, state:AgentState):
-        queries = self.model.with_structured_output(Queries).invoke([
+        queries = structured(self.model, Queries).invoke([
             SystemMessage(content=self.RESEARCH_CRITIQUE_PROMPT),
             HumanMessage(content=state["critique"])
         ])
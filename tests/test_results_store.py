@@ -0,0 +1,32 @@
+from agenticpr.results_store import ResultsStore
+
+
+def test_beam_candidates_keep_their_own_verdicts(tmp_path):
+    store = ResultsStore(str(tmp_path / "results.sqlite"))
+    best = {"outcome": "plausible", "passed": 5, "total": 5, "fingerprint": "b"}
+    result = {
+        "id": "0:abc", "program": "BITCOUNT", "patch": "best diff", "validation": best,
+        "patches": [
+            {"revision": 0, "patch": "best diff", "explanation": "", "validation": best},
+            {"revision": 0, "patch": "other diff", "explanation": "",
+             "validation": {"outcome": "failing", "passed": 3, "total": 5, "fingerprint": "o"}},
+        ],
+    }
+    run = store.record_run(result, "beam", validated=True)
+    rows = store.conn.execute("SELECT patch, outcome, passed, fingerprint FROM patches WHERE run = ? ORDER BY patch",
+                              (run,)).fetchall()
+    assert rows == [("best diff", "plausible", 5, "b"), ("other diff", "failing", 3, "o")]
+    store.close()
+
+
+def test_run_verdict_goes_to_the_final_patch_only(tmp_path):
+    store = ResultsStore(str(tmp_path / "results.sqlite"))
+    result = {
+        "id": "0:abc", "program": "BITCOUNT", "patch": "second", "validation": {"outcome": "plausible"},
+        "patches": [{"revision": 0, "patch": "first"}, {"revision": 1, "patch": "second"}],
+    }
+    run = store.record_run(result, "graph", validated=True)
+    rows = store.conn.execute("SELECT patch, outcome FROM patches WHERE run = ? ORDER BY revision",
+                              (run,)).fetchall()
+    assert rows == [("first", None), ("second", "plausible")]
+    store.close()
@@ -0,0 +1,290 @@
+import os
+import re
+import sqlite3
+import threading
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional
+
+from util.java_source import TEST_HEADER, extract_structure
+
+IGNORED_DIRS = ("build", ".gradle", "target", ".git", "bin", "out")
+TEST_DIRS = ("test", "tests", "java_testcases")
+INDEX_VERSION = 2  # bumped when parsing changes, older indexes are rebuilt
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    mtime REAL,
+    package TEXT
+);
+CREATE TABLE IF NOT EXISTS methods (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    file TEXT,
+    package TEXT,
+    class TEXT,
+    name TEXT,
+    arity INTEGER,
+    start INTEGER,
+    stop INTEGER,
+    is_test INTEGER
+);
+CREATE INDEX IF NOT EXISTS methods_file ON methods (file);
+CREATE INDEX IF NOT EXISTS methods_name ON methods (name, class);
+CREATE TABLE IF NOT EXISTS calls (
+    caller INTEGER REFERENCES methods (id),
+    file TEXT,
+    name TEXT,
+    receiver TEXT,
+    arity INTEGER,
+    line INTEGER
+);
+CREATE INDEX IF NOT EXISTS calls_file ON calls (file);
+CREATE TABLE IF NOT EXISTS edges (
+    caller INTEGER REFERENCES methods (id),
+    callee INTEGER REFERENCES methods (id),
+    line INTEGER
+);
+CREATE INDEX IF NOT EXISTS edges_caller ON edges (caller);
+CREATE INDEX IF NOT EXISTS edges_callee ON edges (callee);
+"""
+
+PACKAGE = re.compile(r"^\s*package\s+([\w.]+)\s*;", re.MULTILINE)
+TEST_ID = re.compile(r"^([\w.$]+)::([\w$]+)$")  # defects4j style org.foo.BarTest::testBaz
+CALL = re.compile(r"(?:\b([A-Z][\w$]*)\s*\.\s*)?([a-zA-Z_$][\w$]*)\s*\(")
+NEW = re.compile(r"\bnew\s+([A-Z][\w$]*)\s*(?:<[^()]*>)?\s*\(")
+ANNOTATION = re.compile(r"@[\w.]+(?:\s*\([^)]*\))?")
+TEST_NAME = re.compile(r"void\s+([\w$]+)\s*\(")
+IGNORED_CALLS = ("assertEquals", "assertTrue", "assertFalse", "format", "asList")
+
+
+def is_test(path: str, class_name: Optional[str], annotations: List[str] = ()) -> bool:
+    """Test code: @Test methods, FooTest, TestFoo and QuixBugs' FOO_TEST
+    classes, and everything under a test source root"""
+    if "Test" in annotations:
+        return True
+    if class_name and (class_name.endswith("Test") or class_name.startswith("Test") or class_name.endswith("_TEST")):
+        return True
+    return any(part in TEST_DIRS for part in path.split(os.sep)[:-1])
+
+
+def parse_file(path: str) -> Optional[Dict]:
+    """Package and JavaStructure of one file as plain data, None if it does not
+    parse. Top level so it can run in a worker process"""
+    try:
+        with open(path, encoding="utf-8", errors="replace") as f:
+            source = f.read()
+        structure = extract_structure(source)
+    except (OSError, ValueError) as e:
+        print(f"Skipping {path}: {e}")
+        return None
+    package = PACKAGE.search(source)
+    return {"package": package.group(1) if package else "", "classes": structure.classes,
+            "fields": structure.fields, "methods": structure.methods}
+
+
+def entry_points(failed_tests: List[str], test_class: str = None) -> List[Dict]:
+    """Methods the failing tests start from: Class::method ids as given by
+    defects4j, or for test source code the test method itself and the
+    constructors and Class.method(...) calls in its body. Unqualified calls
+    are helpers of the test class, only kept when test_class is known, a bare
+    name would match every method of that name in the workspace"""
+    points = []
+
+    def add(class_name, name):
+        point = {"class": class_name, "name": name}
+        if point not in points and name not in IGNORED_CALLS:
+            points.append(point)
+
+    for test in failed_tests:
+        match = TEST_ID.match(test.strip())
+        if match:
+            add(match.group(1).split(".")[-1], match.group(2))
+            continue
+        header = TEST_HEADER.match(test)
+        body = test[header.end():] if header else test
+        if header and test_class:
+            add(test_class, TEST_NAME.search(header.group()).group(1))
+        body = ANNOTATION.sub("", body)
+        for class_name in NEW.findall(body):
+            add(class_name, class_name)
+        for class_name, name in CALL.findall(NEW.sub("(", body)):
+            if class_name or test_class:
+                add(class_name or test_class, name)
+    return points
+
+
+class CallGraph():
+    """Persistent call graph of the java files of a workspace.
+
+    Files are parsed with the util grammar and only re-parsed when their mtime
+    changes. Call sites are stored unresolved and resolved to methods by name,
+    arity and receiver after every update, so edges into a changed file stay
+    correct. Unqualified calls resolve within the class and its superclasses,
+    Class.method calls to that class and calls on other receivers to every
+    method with that name and arity, unless there are too many of them"""
+    def __init__(self, workspace: str, path: str = None, workers: int = 1, max_candidates: int = 3):
+        self.workspace = workspace
+        self.path = path or os.path.join(workspace, ".apr_index.sqlite")
+        self.workers = workers
+        self.max_candidates = max_candidates
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(self.path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript(SCHEMA)
+        if self.conn.execute("PRAGMA user_version").fetchone()[0] != INDEX_VERSION:
+            self.conn.execute("DELETE FROM files")  # every file is parsed again on the next update
+            self.conn.execute(f"PRAGMA user_version = {INDEX_VERSION}")
+        self.conn.commit()
+
+    def java_files(self) -> Dict[str, float]:
+        files = {}
+        for directory, dirs, names in os.walk(self.workspace):
+            dirs[:] = [d for d in dirs if d not in IGNORED_DIRS and not d.startswith(".")]
+            for name in names:
+                if name.endswith(".java"):
+                    path = os.path.join(directory, name)
+                    files[os.path.relpath(path, self.workspace)] = os.path.getmtime(path)
+        return files
+
+    def update(self) -> int:
+        """Re-index added, changed and deleted files, returns how many changed"""
+        current = self.java_files()
+        with self.lock:
+            known = dict(self.conn.execute("SELECT path, mtime FROM files").fetchall())
+        changed = [path for path, mtime in current.items() if known.get(path) != mtime]
+        deleted = [path for path in known if path not in current]
+        if not changed and not deleted:
+            return 0
+        paths = [os.path.join(self.workspace, path) for path in changed]
+        if self.workers > 1 and len(paths) > 1:
+            with ProcessPoolExecutor(max_workers=self.workers) as executor:
+                parsed = list(executor.map(parse_file, paths, chunksize=16))
+        else:
+            parsed = [parse_file(path) for path in paths]
+        with self.lock:
+            for path in deleted + changed:
+                self._remove(path)
+            for path, data in zip(changed, parsed):
+                self.conn.execute("INSERT INTO files VALUES (?, ?, ?)",
+                                  (path, current[path], data["package"] if data else None))
+                if data is not None:
+                    self._index(path, data)
+            self._resolve()
+            self.conn.commit()
+        return len(changed) + len(deleted)
+
+    def _remove(self, path: str):
+        self.conn.execute("DELETE FROM files WHERE path = ?", (path,))
+        self.conn.execute("DELETE FROM calls WHERE file = ?", (path,))
+        self.conn.execute("DELETE FROM methods WHERE file = ?", (path,))
+
+    def _index(self, path: str, data: Dict):
+        for method in data["methods"]:
+            cursor = self.conn.execute(
+                "INSERT INTO methods (file, package, class, name, arity, start, stop, is_test) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (path, data["package"], method["class"], method["name"], method["arity"], method["start"],
+                 method["stop"], int(is_test(path, method["class"], method["annotations"]))))
+            self.conn.executemany(
+                "INSERT INTO calls VALUES (?, ?, ?, ?, ?, ?)",
+                [(cursor.lastrowid, path, call["name"], call["receiver"], call["arity"], call["line"])
+                 for call in method["calls"]])
+
+    def superclasses(self) -> Dict[str, str]:
+        """Class name -> simple name of the class it extends. Not stored by the
+        call graph itself, subclasses keeping the class table override it"""
+        return {}
+
+    def _resolve(self):
+        methods = self.conn.execute("SELECT id, class, name, arity FROM methods").fetchall()
+        by_name, by_class = defaultdict(list), defaultdict(list)
+        for method_id, class_name, name, arity in methods:
+            by_name[(name, arity)].append(method_id)
+            by_class[(class_name, name, arity)].append(method_id)
+            by_class[(class_name, name, None)].append(method_id)
+        caller_class = {method_id: class_name for method_id, class_name, _, _ in methods}
+        parents = self.superclasses()
+
+        def in_hierarchy(class_name, name, arity):
+            seen = set()
+            while class_name and class_name not in seen:
+                seen.add(class_name)
+                if by_class.get((class_name, name, arity)):
+                    return by_class[(class_name, name, arity)]
+                class_name = parents.get(class_name)
+            return []
+
+        edges = []
+        for caller, name, receiver, arity, line in self.conn.execute(
+                "SELECT caller, name, receiver, arity, line FROM calls").fetchall():
+            if receiver == "new":  # constructor of the created class
+                targets = by_class.get((name, name, None), [])
+            elif receiver in (None, "this", "super"):
+                targets = in_hierarchy(caller_class.get(caller), name, arity)
+            elif receiver.split(".")[-1][:1].isupper():  # Class.method or pkg.Class.method
+                targets = in_hierarchy(receiver.split(".")[-1], name, arity)
+            else:
+                targets = by_name.get((name, arity), [])
+                if len(targets) > self.max_candidates:
+                    targets = []  # e.g. toString() on an unknown type, would connect everything
+            edges += [(caller, target, line) for target in targets]
+        self.conn.execute("DELETE FROM edges")
+        self.conn.executemany("INSERT INTO edges VALUES (?, ?, ?)", edges)
+
+    def find(self, name: str, class_name: str = None) -> List[int]:
+        with self.lock:
+            if class_name:
+                rows = self.conn.execute("SELECT id FROM methods WHERE name = ? AND class = ?", (name, class_name))
+            else:
+                rows = self.conn.execute("SELECT id FROM methods WHERE name = ?", (name,))
+            return [row[0] for row in rows.fetchall()]
+
+    def neighborhood(self, failed_tests: List[str], k: int = 2, max_methods: int = 40,
+                     test_class: str = None) -> List[Dict]:
+        """Methods within k calls of the failing tests' entry points, closest
+        first. Test methods are only kept as entry points"""
+        frontier = []
+        for point in entry_points(failed_tests, test_class):
+            frontier += [m for m in self.find(point["name"], point["class"]) if m not in frontier]
+        depth = {method_id: 0 for method_id in frontier}
+        for hop in range(1, k + 1):
+            if not frontier or len(depth) >= max_methods:
+                break
+            with self.lock:
+                rows = self.conn.execute(
+                    f"SELECT DISTINCT callee FROM edges WHERE caller IN ({', '.join('?' for _ in frontier)})",
+                    frontier).fetchall()
+            frontier = [callee for (callee,) in rows if callee not in depth]
+            for callee in frontier:
+                depth[callee] = hop
+        ids = sorted(depth, key=lambda method_id: depth[method_id])[:max_methods]
+        if not ids:
+            return []
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT id, file, package, class, name, arity, start, stop, is_test FROM methods "
+                f"WHERE id IN ({', '.join('?' for _ in ids)})", ids).fetchall()
+        columns = ["id", "file", "package", "class", "name", "arity", "start", "stop", "is_test"]
+        methods = [dict(zip(columns, row), depth=depth[row[0]]) for row in rows]
+        methods = [m for m in methods if not m["is_test"] or m["depth"] == 0]
+        return sorted(methods, key=lambda m: (m["depth"], m["file"], m["start"]))
+
+    def source(self, method: Dict) -> str:
+        with open(os.path.join(self.workspace, method["file"]), encoding="utf-8", errors="replace") as f:
+            lines = f.read().splitlines()
+        return "\n".join(lines[method["start"] - 1:method["stop"]])
+
+    def render(self, methods: List[Dict], char_budget: int = 12000) -> str:
+        """Source of the methods with their location, closest first, within a budget"""
+        blocks, used = [], 0
+        for method in methods:
+            block = f"// {method['file']}:{method['start']} {method['class']}.{method['name']}\n{self.source(method)}\n"
+            if used + len(block) > char_budget:
+                break
+            blocks.append(block)
+            used += len(block)
+        return "".join(blocks)
+
+    def close(self):
+        self.conn.close()
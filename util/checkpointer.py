@@ -0,0 +1,32 @@
+import os
+from langgraph.checkpoint.memory import MemorySaver
+
+from util.sqlite_saver import SqliteSaver
+from util.dedup_serde import DedupSerializer, MemoryBlobStore, SqliteBlobStore
+
+
+def get_checkpointer(name: str):
+    """Checkpointer for one agent graph. Set CHECKPOINT_DIR to keep checkpoints
+    in <CHECKPOINT_DIR>/<name>.sqlite across restarts, otherwise they stay in memory.
+    CHECKPOINT_KEEP_LAST and CHECKPOINT_MAX_IDLE_HOURS configure retention.
+    Large state values are stored once through DedupSerializer"""
+    checkpoint_dir = os.environ.get("CHECKPOINT_DIR")
+    if not checkpoint_dir:
+        return MemorySaver(serde=DedupSerializer(MemoryBlobStore()))
+    os.makedirs(checkpoint_dir, exist_ok=True)
+    path = os.path.join(checkpoint_dir, f"{name}.sqlite")
+    keep_last = os.environ.get("CHECKPOINT_KEEP_LAST")
+    max_idle = os.environ.get("CHECKPOINT_MAX_IDLE_HOURS")
+    return SqliteSaver(
+        path,
+        keep_last=int(keep_last) if keep_last else None,
+        max_idle=float(max_idle) * 3600 if max_idle else None,
+        compact_interval=float(os.environ.get("CHECKPOINT_COMPACT_SECONDS", 600)),
+        serde=DedupSerializer(SqliteBlobStore(path)),
+    )
+
+
+def existing_threads(checkpointer) -> list:
+    if hasattr(checkpointer, "thread_ids"):
+        return checkpointer.thread_ids()
+    return list(getattr(checkpointer, "storage", {}).keys())
@@ -0,0 +1,143 @@
+import hashlib
+import sqlite3
+import threading
+from typing import Any, Iterable, Tuple
+from langgraph.checkpoint.serde.jsonplus import JsonPlusSerializer
+
+BLOB_KEY = "__blob__"
+BLOB_LIST_KEY = "__blob_list__"
+
+
+class MemoryBlobStore():
+    def __init__(self):
+        self.blobs = {}
+
+    def put(self, digest: str, blob: Tuple[str, bytes]):
+        self.blobs.setdefault(digest, blob)
+
+    def get(self, digest: str) -> Tuple[str, bytes]:
+        return self.blobs[digest]
+
+    def retain(self, live: set):
+        for digest in [d for d in self.blobs if d not in live]:
+            del self.blobs[digest]
+
+
+class SqliteBlobStore():
+    """Blob table kept next to the checkpoints of a SqliteSaver"""
+    def __init__(self, path: str, cache_size: int = 256):
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS blobs (digest TEXT PRIMARY KEY, type TEXT, data BLOB)")
+        self.conn.commit()
+        self.cache_size = cache_size
+        self.cache = {}
+
+    def put(self, digest: str, blob: Tuple[str, bytes]):
+        if digest in self.cache:
+            return
+        with self.lock:
+            self.conn.execute("INSERT OR IGNORE INTO blobs VALUES (?, ?, ?)", (digest, *blob))
+            self.conn.commit()
+        self._remember(digest, blob)
+
+    def get(self, digest: str) -> Tuple[str, bytes]:
+        if digest in self.cache:
+            return self.cache[digest]
+        with self.lock:
+            row = self.conn.execute("SELECT type, data FROM blobs WHERE digest=?", (digest,)).fetchone()
+        if row is None:
+            raise KeyError(f"Missing checkpoint blob {digest}")
+        self._remember(digest, row)
+        return row
+
+    def _remember(self, digest, blob):
+        if len(self.cache) >= self.cache_size:
+            self.cache.pop(next(iter(self.cache)))
+        self.cache[digest] = tuple(blob)
+
+    def retain(self, live: set):
+        with self.lock:
+            stored = [row[0] for row in self.conn.execute("SELECT digest FROM blobs")]
+            dead = [(digest,) for digest in stored if digest not in live]
+            self.conn.executemany("DELETE FROM blobs WHERE digest=?", dead)
+            self.conn.commit()
+        self.cache = {}
+
+
+class DedupSerializer():
+    """Checkpoint serializer that stores large state values once.
+
+    Strings and lists in channel_values (and large pending writes) whose
+    serialized size is at least min_size are moved into a content addressed
+    blob store. The checkpoint keeps {"__blob__": sha256} for a string and
+    {"__blob_list__": [sha256, ...]} for a list, so an unchanged buggy_program
+    or the already seen prefix of a growing list costs one hash per checkpoint."""
+    def __init__(self, store, inner=None, min_size: int = 512):
+        self.store = store
+        self.inner = inner or JsonPlusSerializer()
+        self.min_size = min_size
+
+    def _put(self, value) -> str:
+        blob = self.inner.dumps_typed(value)
+        digest = hashlib.sha256(blob[0].encode() + b"\0" + blob[1]).hexdigest()
+        self.store.put(digest, blob)
+        return digest
+
+    def _get(self, digest: str):
+        return self.inner.loads_typed(self.store.get(digest))
+
+    def _encode(self, value):
+        if isinstance(value, str) and len(value) >= self.min_size:
+            return {BLOB_KEY: self._put(value)}
+        if isinstance(value, list) and value and len(self.inner.dumps_typed(value)[1]) >= self.min_size:
+            return {BLOB_LIST_KEY: [self._put(item) for item in value]}
+        return value
+
+    def _decode(self, value):
+        if isinstance(value, dict) and len(value) == 1:
+            if BLOB_KEY in value:
+                return self._get(value[BLOB_KEY])
+            if BLOB_LIST_KEY in value:
+                return [self._get(digest) for digest in value[BLOB_LIST_KEY]]
+        return value
+
+    def dumps_typed(self, obj: Any) -> Tuple[str, bytes]:
+        if isinstance(obj, dict) and isinstance(obj.get("channel_values"), dict):
+            obj = {**obj, "channel_values": {k: self._encode(v) for k, v in obj["channel_values"].items()}}
+        else:
+            obj = self._encode(obj)
+        return self.inner.dumps_typed(obj)
+
+    def loads_typed(self, data: Tuple[str, bytes]) -> Any:
+        obj = self.inner.loads_typed(data)
+        if isinstance(obj, dict) and isinstance(obj.get("channel_values"), dict):
+            obj["channel_values"] = {k: self._decode(v) for k, v in obj["channel_values"].items()}
+            return obj
+        return self._decode(obj)
+
+    def dumps(self, obj: Any) -> bytes:
+        return self.inner.dumps(obj)
+
+    def loads(self, data: bytes) -> Any:
+        return self.inner.loads(data)
+
+    def references(self, data: Tuple[str, bytes]) -> set:
+        obj = self.inner.loads_typed(data)
+        values = obj["channel_values"].values() if isinstance(obj, dict) and isinstance(
+            obj.get("channel_values"), dict) else [obj]
+        digests = set()
+        for value in values:
+            if isinstance(value, dict) and BLOB_KEY in value:
+                digests.add(value[BLOB_KEY])
+            elif isinstance(value, dict) and BLOB_LIST_KEY in value:
+                digests.update(value[BLOB_LIST_KEY])
+        return digests
+
+    def sweep(self, payloads: Iterable[Tuple[str, bytes]]):
+        """Drop blobs no longer referenced by any of the stored payloads"""
+        live = set()
+        for payload in payloads:
+            live |= self.references(payload)
+        self.store.retain(live)
@@ -0,0 +1,239 @@
+import re
+from typing import override, List, Dict
+from antlr4 import InputStream, CommonTokenStream, ParseTreeWalker, Token
+from antlr4.atn.PredictionMode import PredictionMode
+from antlr4.error.ErrorListener import ErrorListener
+from antlr4.error.ErrorStrategy import BailErrorStrategy
+from antlr4.error.Errors import ParseCancellationException
+
+from util.JavaLexer import JavaLexer
+from util.JavaParser import JavaParser
+from util.JavaListener import JavaListener
+
+# junit boilerplate around a test body: annotations, void test_x() and throws
+TEST_HEADER = re.compile(r"^\s*(@[\w.]+(\([^)]*\))?\s*)*(public\s+)?void\s+[\w$]+\s*\(\s*\)\s*(throws\s+[\w.,\s]+)?\{")
+
+
+def parse_java(source: str, rule: str = "compilationUnit"):
+    """Parse java source with the util grammar. Returns (tree, parser)"""
+    lexer = JavaLexer(InputStream(source))
+    lexer.removeErrorListeners()
+    parser = JavaParser(CommonTokenStream(lexer))
+    parser.removeErrorListeners()
+    tree = getattr(parser, rule)()
+    return tree, parser
+
+
+class SyntaxErrorCollector(ErrorListener):
+    """Keeps lexer and parser errors as dicts instead of printing them"""
+    def __init__(self, line_offset: int = 0):
+        self.line_offset = line_offset
+        self.errors = []
+
+    @override
+    def syntaxError(self, recognizer, offendingSymbol, line, column, msg, e):
+        self.errors.append({
+            "line": line + self.line_offset,
+            "column": column,
+            "token": getattr(offendingSymbol, "text", None),
+            "message": msg,
+        })
+
+
+def syntax_errors(source: str, rule: str = "compilationUnit", line_offset: int = 0) -> List[Dict]:
+    """Syntax errors of source parsed as the given rule, [] if it parses.
+    The fast SLL mode with bail out settles almost every input, the full LL
+    parse only runs on failure to produce accurate error messages"""
+    lexer = JavaLexer(InputStream(source))
+    lexer.removeErrorListeners()
+    parser = JavaParser(CommonTokenStream(lexer))
+    parser.removeErrorListeners()
+    parser._interp.predictionMode = PredictionMode.SLL
+    parser._errHandler = BailErrorStrategy()
+    try:
+        getattr(parser, rule)()
+        if parser.getCurrentToken().type == Token.EOF:
+            return []
+    except ParseCancellationException:
+        pass
+    collector = SyntaxErrorCollector(line_offset)
+    lexer = JavaLexer(InputStream(source))
+    lexer.removeErrorListeners()
+    lexer.addErrorListener(collector)
+    parser = JavaParser(CommonTokenStream(lexer))
+    parser.removeErrorListeners()
+    parser.addErrorListener(collector)
+    getattr(parser, rule)()
+    token = parser.getCurrentToken()
+    if not collector.errors and token.type != Token.EOF:
+        collector.errors.append({"line": token.line + line_offset, "column": token.column, "token": token.text,
+                                 "message": f"extraneous input '{token.text}' after the {rule}"})
+    return collector.errors
+
+
+def _declaration_start(ctx):
+    # modifiers and annotations live on the enclosing body declaration
+    node = ctx
+    while node is not None:
+        if isinstance(node, (JavaParser.ClassBodyDeclarationContext, JavaParser.InterfaceBodyDeclarationContext,
+                             JavaParser.TypeDeclarationContext)):
+            return node.start
+        node = node.parentCtx
+    return ctx.start
+
+
+def _annotations(ctx) -> List[str]:
+    """Simple names of the annotations on a member, Test for @org.junit.Test(...)"""
+    node = ctx
+    while node is not None:
+        if isinstance(node, (JavaParser.ClassBodyDeclarationContext, JavaParser.InterfaceBodyDeclarationContext)):
+            return [m.getText()[1:].split("(")[0].split(".")[-1] for m in node.modifier()
+                    if m.getText().startswith("@")]
+        node = node.parentCtx
+    return []
+
+
+class JavaStructure(JavaListener):
+    """Collects classes, fields, methods and the calls made inside each method"""
+    def __init__(self):
+        self.classes = []
+        self.fields = []
+        self.methods = []
+        self._class_stack = []
+        self._method_stack = []
+
+    def _enter_type(self, ctx, lbrace, extends=None):
+        name = ctx.Identifier().getText()
+        self.classes.append({
+            "name": name,
+            "start": _declaration_start(ctx).line,
+            "body_start": (lbrace.line, lbrace.column),
+            "stop": ctx.stop.line,
+            "extends": extends,
+        })
+        self._class_stack.append(name)
+
+    def _enter_method(self, ctx, body):
+        params = ctx.formalParameters().formalParameterList()
+        arity = 0
+        if params is not None:
+            arity = len(params.formalParameter()) + (1 if params.lastFormalParameter() else 0)
+        method = {
+            "name": ctx.Identifier().getText(),
+            "class": self._class_stack[-1] if self._class_stack else None,
+            "params": ctx.formalParameters().getText(),
+            "arity": arity,
+            "start": _declaration_start(ctx).line,
+            "body_start": (body.start.line, body.start.column) if body is not None else None,
+            "stop": ctx.stop.line,
+            "annotations": _annotations(ctx),
+            "calls": [],
+        }
+        self.methods.append(method)
+        self._method_stack.append(method)
+
+    @override
+    def enterClassDeclaration(self, ctx):
+        extends = ctx.typeSpec().getText() if ctx.typeSpec() else None
+        self._enter_type(ctx, ctx.classBody().start, extends)
+
+    @override
+    def exitClassDeclaration(self, ctx):
+        self._class_stack.pop()
+
+    @override
+    def enterEnumDeclaration(self, ctx):
+        self._enter_type(ctx, ctx.LBRACE().symbol)
+
+    @override
+    def exitEnumDeclaration(self, ctx):
+        self._class_stack.pop()
+
+    @override
+    def enterInterfaceDeclaration(self, ctx):
+        self._enter_type(ctx, ctx.interfaceBody().start)
+
+    @override
+    def exitInterfaceDeclaration(self, ctx):
+        self._class_stack.pop()
+
+    @override
+    def enterFieldDeclaration(self, ctx):
+        if not self._method_stack:
+            self.fields.append({
+                "class": self._class_stack[-1] if self._class_stack else None,
+                "start": _declaration_start(ctx).line,
+                "stop": ctx.stop.line,
+                "type": ctx.typeSpec().getText(),
+                "names": [d.variableDeclaratorId().getText() for d in ctx.variableDeclarators().variableDeclarator()],
+            })
+
+    @override
+    def enterMethodDeclaration(self, ctx):
+        self._enter_method(ctx, ctx.methodBody())
+
+    @override
+    def exitMethodDeclaration(self, ctx):
+        self._method_stack.pop()
+
+    @override
+    def enterInterfaceMethodDeclaration(self, ctx):
+        self._enter_method(ctx, None)
+
+    @override
+    def exitInterfaceMethodDeclaration(self, ctx):
+        self._method_stack.pop()
+
+    @override
+    def enterConstructorDeclaration(self, ctx):
+        self._enter_method(ctx, ctx.constructorBody())
+
+    @override
+    def exitConstructorDeclaration(self, ctx):
+        self._method_stack.pop()
+
+    @override
+    def enterExpression(self, ctx):
+        # expression '(' expressionList? ')'
+        if not self._method_stack or ctx.getChildCount() < 3 or ctx.getChild(1).getText() != "(":
+            return
+        callee = ctx.getChild(0)
+        if not isinstance(callee, JavaParser.ExpressionContext):
+            return
+        receiver = None
+        if callee.Identifier() is not None:
+            name = callee.Identifier().getText()
+            receiver = callee.expression(0).getText() if callee.expression(0) else None
+        elif callee.primary() is not None and callee.primary().Identifier() is not None:
+            name = callee.primary().Identifier().getText()
+        else:
+            return
+        args = ctx.expressionList()
+        self._method_stack[-1]["calls"].append({
+            "name": name,
+            "receiver": receiver,
+            "arity": len(args.expression()) if args else 0,
+            "line": ctx.start.line,
+        })
+
+    @override
+    def enterCreator(self, ctx):
+        created = ctx.createdName()
+        if self._method_stack and created is not None and created.Identifier():
+            self._method_stack[-1]["calls"].append({
+                "name": created.Identifier(0).getText(),
+                "receiver": "new",
+                "arity": -1,
+                "line": ctx.start.line,
+            })
+
+
+def extract_structure(source: str) -> JavaStructure:
+    """Walk the program once and return its JavaStructure.
+    Raises ValueError if the source does not parse"""
+    tree, parser = parse_java(source)
+    if parser.getNumberOfSyntaxErrors() > 0:
+        raise ValueError(f"{parser.getNumberOfSyntaxErrors()} syntax error(s) in java source")
+    structure = JavaStructure()
+    ParseTreeWalker().walk(structure, tree)
+    return structure
@@ -0,0 +1,183 @@
+from typing import Dict, List
+
+from util.call_graph import CallGraph, entry_points, is_test
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS classes (
+    file TEXT,
+    package TEXT,
+    name TEXT,
+    extends TEXT,
+    start INTEGER,
+    stop INTEGER,
+    is_test INTEGER
+);
+CREATE INDEX IF NOT EXISTS classes_file ON classes (file);
+CREATE INDEX IF NOT EXISTS classes_name ON classes (name);
+CREATE INDEX IF NOT EXISTS classes_extends ON classes (extends);
+CREATE TABLE IF NOT EXISTS fields (
+    file TEXT,
+    class TEXT,
+    name TEXT,
+    type TEXT,
+    line INTEGER
+);
+CREATE INDEX IF NOT EXISTS fields_file ON fields (file);
+CREATE INDEX IF NOT EXISTS fields_class ON fields (class);
+CREATE TABLE IF NOT EXISTS test_links (
+    test INTEGER REFERENCES methods (id),
+    method INTEGER REFERENCES methods (id),
+    depth INTEGER
+);
+CREATE INDEX IF NOT EXISTS test_links_method ON test_links (method);
+CREATE INDEX IF NOT EXISTS test_links_test ON test_links (test);
+"""
+
+QUERY_KINDS = ("class", "method", "tests", "subclasses")
+
+
+def simple_name(type_name: str) -> str:
+    """Bar for org.foo.Bar<T>"""
+    return type_name.split("<")[0].split(".")[-1] if type_name else type_name
+
+
+class KnowledgeGraph(CallGraph):
+    """Project index for the understanding stage: classes with their
+    superclass, fields, methods, calls and the code methods each test reaches.
+
+    Built on the call graph tables and updated with them, file by file. Every
+    query is a few indexed lookups with a row limit, so the understander can
+    ask it questions for a bounded cost instead of reading files"""
+    def __init__(self, workspace: str, path: str = None, workers: int = 1, max_candidates: int = 3,
+                 test_depth: int = 2, limit: int = 20):
+        super().__init__(workspace, path, workers, max_candidates)
+        self.test_depth = test_depth
+        self.limit = limit
+        self.conn.executescript(SCHEMA)
+        if (self.conn.execute("SELECT COUNT(*) FROM methods").fetchone()[0]
+                and not self.conn.execute("SELECT COUNT(*) FROM classes").fetchone()[0]):
+            self.conn.execute("DELETE FROM files")  # indexed by a plain CallGraph, parse again for the class tables
+        self.conn.commit()
+
+    def _remove(self, path: str):
+        super()._remove(path)
+        self.conn.execute("DELETE FROM classes WHERE file = ?", (path,))
+        self.conn.execute("DELETE FROM fields WHERE file = ?", (path,))
+
+    def _index(self, path: str, data: Dict):
+        super()._index(path, data)
+        annotated = {m["class"] for m in data["methods"] if "Test" in m["annotations"]}
+        self.conn.executemany(
+            "INSERT INTO classes VALUES (?, ?, ?, ?, ?, ?, ?)",
+            [(path, data["package"], c["name"], simple_name(c["extends"]), c["start"], c["stop"],
+              int(c["name"] in annotated or is_test(path, c["name"]))) for c in data["classes"]])
+        self.conn.executemany(
+            "INSERT INTO fields VALUES (?, ?, ?, ?, ?)",
+            [(path, f["class"], name, f["type"], f["start"]) for f in data["fields"] for name in f["names"]])
+
+    def superclasses(self) -> Dict[str, str]:
+        return dict(self.conn.execute("SELECT name, extends FROM classes WHERE extends IS NOT NULL").fetchall())
+
+    def _resolve(self):
+        super()._resolve()
+        # tests -> code methods they reach within test_depth calls, recomputed with the edges
+        self.conn.execute("DELETE FROM test_links")
+        self.conn.execute(
+            "INSERT INTO test_links SELECT DISTINCT e.caller, e.callee, 1 FROM edges e "
+            "JOIN methods t ON t.id = e.caller JOIN methods m ON m.id = e.callee "
+            "WHERE t.is_test = 1 AND m.is_test = 0")
+        for depth in range(2, self.test_depth + 1):
+            self.conn.execute(
+                "INSERT INTO test_links SELECT DISTINCT l.test, e.callee, ? FROM test_links l "
+                "JOIN edges e ON e.caller = l.method JOIN methods m ON m.id = e.callee "
+                "WHERE l.depth = ? AND m.is_test = 0 "
+                "AND NOT EXISTS (SELECT 1 FROM test_links o WHERE o.test = l.test AND o.method = e.callee)",
+                (depth, depth - 1))
+
+    def _rows(self, sql: str, params=()) -> List:
+        with self.lock:
+            return self.conn.execute(sql, params).fetchall()
+
+    def describe_class(self, name: str) -> str:
+        lines = []
+        for file, package, extends, start, stop in self._rows(
+                "SELECT file, package, extends, start, stop FROM classes WHERE name = ? LIMIT ?", (name, self.limit)):
+            lines.append(f"class {package + '.' if package else ''}{name}"
+                         f"{' extends ' + extends if extends else ''} ({file}:{start}-{stop})")
+        if not lines:
+            return f"No class {name}"
+        fields = self._rows("SELECT type, name FROM fields WHERE class = ? LIMIT ?", (name, self.limit))
+        methods = self._rows("SELECT name, arity, start FROM methods WHERE class = ? ORDER BY start LIMIT ?",
+                             (name, self.limit))
+        subclasses = self._rows("SELECT name FROM classes WHERE extends = ? LIMIT ?", (name, self.limit))
+        lines.append(f"fields: {', '.join(f'{t} {n}' for t, n in fields) or '-'}")
+        lines.append(f"methods: {', '.join(f'{n}/{a}@{s}' for n, a, s in methods) or '-'}")
+        lines.append(f"subclasses: {', '.join(n for (n,) in subclasses) or '-'}")
+        return "\n".join(lines)
+
+    def _method_ids(self, name: str) -> List[int]:
+        class_name, _, method = name.rpartition(".")
+        return self.find(method, class_name or None)[:self.limit]
+
+    def describe_method(self, name: str) -> str:
+        ids = self._method_ids(name)
+        if not ids:
+            return f"No method {name}"
+        lines = []
+        for method_id in ids:
+            (file, class_name, method, arity, start, stop), = self._rows(
+                "SELECT file, class, name, arity, start, stop FROM methods WHERE id = ?", (method_id,))
+            callees = self._rows(
+                "SELECT DISTINCT m.class, m.name FROM edges e JOIN methods m ON m.id = e.callee "
+                "WHERE e.caller = ? LIMIT ?", (method_id, self.limit))
+            callers = self._rows(
+                "SELECT DISTINCT m.class, m.name FROM edges e JOIN methods m ON m.id = e.caller "
+                "WHERE e.callee = ? LIMIT ?", (method_id, self.limit))
+            lines.append(f"{class_name}.{method}/{arity} ({file}:{start}-{stop})")
+            lines.append(f"calls: {', '.join(f'{c}.{n}' for c, n in callees) or '-'}")
+            lines.append(f"called by: {', '.join(f'{c}.{n}' for c, n in callers) or '-'}")
+        return "\n".join(lines)
+
+    def tests_of(self, name: str) -> str:
+        """Tests reaching a method (Class.method) or any method of a class"""
+        if "." not in name and name[:1].isupper():  # a class
+            ids = [row[0] for row in self._rows("SELECT id FROM methods WHERE class = ? LIMIT ?", (name, self.limit))]
+        else:
+            ids = self._method_ids(name)
+        if not ids:
+            return f"No method or class {name}"
+        rows = self._rows(
+            "SELECT DISTINCT t.class, t.name, MIN(l.depth) FROM test_links l JOIN methods t ON t.id = l.test "
+            f"WHERE l.method IN ({', '.join('?' for _ in ids)}) GROUP BY t.id ORDER BY 3 LIMIT ?",
+            (*ids, self.limit))
+        return "\n".join(f"{c}.{n} (depth {d})" for c, n, d in rows) or f"No test reaches {name}"
+
+    def subclasses_of(self, name: str) -> str:
+        rows = self._rows("SELECT name, file FROM classes WHERE extends = ? LIMIT ?", (name, self.limit))
+        return "\n".join(f"{n} ({f})" for n, f in rows) or f"No subclass of {name}"
+
+    def query(self, kind: str, name: str) -> str:
+        """Answer one knowledge graph question, kind is one of QUERY_KINDS"""
+        handlers = {"class": self.describe_class, "method": self.describe_method, "tests": self.tests_of,
+                    "subclasses": self.subclasses_of}
+        if kind not in handlers:
+            return f"Unknown query kind {kind}, expected one of {', '.join(QUERY_KINDS)}"
+        return handlers[kind](simple_name(name) if kind in ("class", "subclasses") else name)
+
+    def overview(self, failed_tests: List[str], k: int = 1, char_budget: int = 4000, test_class: str = None) -> str:
+        """Classes around the failing tests and their direct calls, the starting
+        point handed to the understander"""
+        classes = []
+        for point in entry_points(failed_tests, test_class):
+            if point["class"] not in classes:
+                classes.append(point["class"])
+        for method in self.neighborhood(failed_tests, k=k, max_methods=self.limit, test_class=test_class):
+            if method["class"] not in classes:
+                classes.append(method["class"])
+        text = ""
+        for name in classes:
+            block = f"{self.describe_class(name)}\n"
+            if len(text) + len(block) > char_budget:
+                break
+            text += block
+        return text
@@ -0,0 +1,239 @@
+import os
+import json
+import time
+import hashlib
+import threading
+from datetime import datetime
+from typing import Any, List, Optional
+from dotenv import load_dotenv
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage, message_to_dict, messages_from_dict
+from langchain_core.outputs import ChatGeneration, ChatResult
+from langchain_core.utils.function_calling import convert_to_openai_tool
+from langchain_openai import ChatOpenAI
+import httpx
+
+from util.rate_limiter import RateLimitedTransport, limiter
+
+_ = load_dotenv()
+
+GITHUB_MODELS_URL = "https://models.inference.ai.azure.com"
+
+_lock = threading.Lock()
+_http_client = None
+_models = {}
+_runnables = {}
+
+
+def _message_key(message: BaseMessage) -> dict:
+    # ids are generated per run, only the content identifies a request
+    return {
+        "type": message.type,
+        "content": message.content,
+        "tool_calls": getattr(message, "tool_calls", []),
+        "tool_call_id": getattr(message, "tool_call_id", None),
+    }
+
+
+class CassetteChatModel(BaseChatModel):
+    """Chat model that serves responses from cassettes on disk.
+
+    Every request is keyed by a hash of the model, temperature, messages and
+    bound tools. In "replay" mode a missing cassette is an error, in "record"
+    mode it is fetched from the delegate model and saved, so a recorded run can
+    be replayed offline with the same structured outputs and tool calls."""
+    model_name: str
+    temperature: float = 0
+    cassette_dir: str = "cassettes"
+    mode: str = "replay"
+    latency: float = 0.0
+    delegate: Optional[BaseChatModel] = None
+
+    @property
+    def _llm_type(self) -> str:
+        return "cassette"
+
+    def request_key(self, messages: List[BaseMessage], **kwargs) -> str:
+        request = {
+            "model": self.model_name,
+            "temperature": float(self.temperature),
+            "messages": [_message_key(m) for m in messages],
+            "tools": kwargs.get("tools"),
+            "tool_choice": kwargs.get("tool_choice"),
+        }
+        return hashlib.sha256(json.dumps(request, sort_keys=True, default=str).encode()).hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cassette_dir, f"{key}.json")
+
+    def _record(self, messages: List[BaseMessage], path: str, **kwargs) -> AIMessage:
+        model = self.delegate
+        if kwargs.get("tools"):
+            model = model.bind_tools(kwargs["tools"], tool_choice=kwargs.get("tool_choice"))
+        response = model.invoke(messages)
+        os.makedirs(self.cassette_dir, exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(message_to_dict(response), f)
+        os.replace(tmp, path)  # parallel recorders never leave a half written cassette
+        return response
+
+    def _generate(self, messages: List[BaseMessage], stop=None, run_manager=None, **kwargs: Any) -> ChatResult:
+        path = self._path(self.request_key(messages, **kwargs))
+        if os.path.exists(path):
+            with open(path) as f:
+                response = messages_from_dict([json.load(f)])[0]
+            if self.latency:
+                time.sleep(self.latency)
+        elif self.mode == "record":
+            response = self._record(messages, path, **kwargs)
+        else:
+            raise ValueError(f"No cassette {path} for this request, record it with LLM_MODE=record")
+        return ChatResult(generations=[ChatGeneration(message=response)])
+
+    def bind_tools(self, tools, tool_choice=None, **kwargs):
+        formatted = [convert_to_openai_tool(tool) for tool in tools]
+        return self.bind(tools=formatted, tool_choice=tool_choice, **kwargs)
+
+
+class CassetteSearchClient():
+    """Tavily stand-in with the same record/replay cassettes as the chat model"""
+    def __init__(self, cassette_dir="cassettes", mode="replay", delegate=None):
+        self.cassette_dir = cassette_dir
+        self.mode = mode
+        self.delegate = delegate
+
+    def search(self, query: str, **kwargs) -> dict:
+        request = json.dumps({"search": query, **kwargs}, sort_keys=True)
+        path = os.path.join(self.cassette_dir, f"{hashlib.sha256(request.encode()).hexdigest()}.json")
+        if os.path.exists(path):
+            with open(path) as f:
+                return json.load(f)
+        if self.mode != "record":
+            raise ValueError(f"No cassette {path} for search '{query}', record it with LLM_MODE=record")
+        response = self.delegate.search(query, **kwargs)
+        os.makedirs(self.cassette_dir, exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(response, f)
+        os.replace(tmp, path)
+        return response
+
+
+def get_http_client() -> httpx.Client:
+    """Connection pool shared by every model handle in the process. HTTP/2 lets
+    concurrent calls multiplex over one kept-alive connection to the endpoint"""
+    global _http_client
+    with _lock:
+        if _http_client is None:
+            transport = httpx.HTTPTransport(
+                http2=True,
+                limits=httpx.Limits(
+                    max_connections=int(os.environ.get("LLM_MAX_CONNECTIONS", 20)),
+                    max_keepalive_connections=int(os.environ.get("LLM_MAX_KEEPALIVE", 10)),
+                    keepalive_expiry=120
+                )
+            )
+            _http_client = httpx.Client(
+                transport=RateLimitedTransport(limiter, transport),
+                timeout=httpx.Timeout(120, connect=10)
+            )
+        return _http_client
+
+
+def _openai_model(model: str, temperature: float, callbacks=None) -> ChatOpenAI:
+    # retries are done by the rate limited transport, which knows about the shared budget
+    return ChatOpenAI(
+        model=model,
+        base_url=GITHUB_MODELS_URL,
+        api_key=os.environ['GITHUB_TOKEN'],
+        temperature=temperature,
+        stream_usage=True,
+        max_retries=0,
+        http_client=get_http_client(),
+        callbacks=callbacks
+    )
+
+
+def get_chat_model(model: str = "gpt-4o", temperature: float = 0, callbacks=None) -> BaseChatModel:
+    """Chat model for the agents, selected by LLM_MODE (live, record or replay).
+    Replay needs no network access or GITHUB_TOKEN, LLM_REPLAY_LATENCY adds a
+    fixed delay in seconds to every replayed call. Handles are cached, agents
+    asking for the same model share one instance"""
+    mode = os.environ.get("LLM_MODE", "live")
+    key = (mode, model, float(temperature), tuple(callbacks or ()))
+    with _lock:
+        if key in _models:
+            return _models[key]
+    handle = _build_model(mode, model, temperature, callbacks)
+    with _lock:
+        return _models.setdefault(key, handle)
+
+
+def _build_model(mode: str, model: str, temperature: float, callbacks=None) -> BaseChatModel:
+    if mode == "live":
+        return _openai_model(model, temperature, callbacks)
+    if mode not in ("record", "replay"):
+        raise ValueError(f"Unknown LLM_MODE {mode}, expected live, record or replay")
+    delegate = None
+    if mode == "record":
+        delegate = _openai_model(model, temperature)
+    return CassetteChatModel(
+        model_name=model,
+        temperature=temperature,
+        cassette_dir=os.environ.get("LLM_CASSETTE_DIR", "cassettes"),
+        mode=mode,
+        latency=float(os.environ.get("LLM_REPLAY_LATENCY", 0)),
+        delegate=delegate,
+        callbacks=callbacks
+    )
+
+
+def current_date() -> datetime:
+    """Now, or the fixed LLM_CASSETTE_DATE (YYYY-MM-DD, default 2025-01-06) in
+    record and replay mode. Cassettes are keyed on the messages, a prompt
+    holding the real date would only replay on the day it was recorded"""
+    if os.environ.get("LLM_MODE", "live") in ("record", "replay"):
+        return datetime.strptime(os.environ.get("LLM_CASSETTE_DATE", "2025-01-06"), "%Y-%m-%d")
+    return datetime.now()
+
+
+def _cached_runnable(model: BaseChatModel, key, build):
+    with _lock:
+        entry = _runnables.get((id(model), key))
+    if entry is None:
+        # the model is kept in the entry so its id cannot be reused while cached
+        entry = (model, build())
+        with _lock:
+            entry = _runnables.setdefault((id(model), key), entry)
+    return entry[1]
+
+
+def structured(model: BaseChatModel, schema):
+    """model.with_structured_output(schema), built once per model and schema"""
+    return _cached_runnable(model, ("structured", schema), lambda: model.with_structured_output(schema))
+
+
+def forced_tool(model: BaseChatModel, schema):
+    """model bound to answer with one call of the schema as a tool, for
+    streaming the arguments of a structured output as they are generated"""
+    return _cached_runnable(model, ("forced", schema),
+                            lambda: model.bind_tools([schema], tool_choice=schema.__name__))
+
+
+def with_tools(model: BaseChatModel, tools: List):
+    """model.bind_tools(tools), built once per model and tool set"""
+    key = ("tools", tuple(tool.name for tool in tools))
+    return _cached_runnable(model, key, lambda: model.bind_tools(tools=tools))
+
+
+def get_search_client():
+    """Tavily client following LLM_MODE, so the writer can also run offline"""
+    mode = os.environ.get("LLM_MODE", "live")
+    if mode == "replay":
+        return CassetteSearchClient(os.environ.get("LLM_CASSETTE_DIR", "cassettes"), mode)
+    from tavily import TavilyClient
+    client = TavilyClient(api_key=os.environ['TAVILY_API_KEY'])
+    if mode == "record":
+        return CassetteSearchClient(os.environ.get("LLM_CASSETTE_DIR", "cassettes"), mode, client)
+    return client
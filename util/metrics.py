@@ -0,0 +1,127 @@
+import csv
+import json
+import time
+import contextvars
+from typing import Dict, List
+from langchain_core.callbacks import BaseCallbackHandler
+
+METRIC_FIELDS = ["graph", "node", "thread_id", "step", "started", "wall_time", "llm_latency", "llm_calls",
+                 "prompt_tokens", "completion_tokens", "cached_tokens", "retries", "cache_hits", "errors",
+                 "queue_wait", "saved_tokens"]
+
+# record of the node currently executing in this context
+_current_record = contextvars.ContextVar("node_metrics", default=None)
+
+
+def new_record(graph: str, node: str, thread_id=None, step=None) -> Dict:
+    record = {key: 0 for key in METRIC_FIELDS}
+    record.update({"graph": graph, "node": node, "thread_id": thread_id, "step": step, "started": time.time()})
+    return record
+
+
+def bump(key: str, amount=1):
+    """Add to a counter of the node record active in this context, if any"""
+    record = _current_record.get()
+    if record is not None:
+        record[key] = record.get(key, 0) + amount
+
+
+def instrument(graph: str, node: str, fn):
+    """Wrap a graph node so every call appends a metrics record to state["metrics"]"""
+    # no functools.wraps: langgraph reads the signature to decide whether to pass config
+    def wrapper(state, config):
+        configurable = config.get("configurable", {}) if config else {}
+        metadata = config.get("metadata", {}) if config else {}
+        record = new_record(graph, node, configurable.get("thread_id"), metadata.get("langgraph_step"))
+        token = _current_record.set(record)
+        start = time.perf_counter()
+        try:
+            result = fn(state)
+        finally:
+            record["wall_time"] = round(time.perf_counter() - start, 4)
+            _current_record.reset(token)
+        if isinstance(result, dict):
+            result = {**result, "metrics": [record]}
+        return result
+    wrapper.__name__ = fn.__name__
+    wrapper.__doc__ = fn.__doc__
+    return wrapper
+
+
+class UsageCallbackHandler(BaseCallbackHandler):
+    """Attributes LLM latency and token usage to the active node record"""
+    def __init__(self):
+        self._starts = {}
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs):
+        self._starts[run_id] = time.perf_counter()
+
+    def on_llm_start(self, serialized, prompts, *, run_id, **kwargs):
+        self._starts[run_id] = time.perf_counter()
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        start = self._starts.pop(run_id, None)
+        if start is not None:
+            bump("llm_latency", round(time.perf_counter() - start, 4))
+        bump("llm_calls")
+        prompt_tokens, completion_tokens, cached_tokens = 0, 0, 0
+        for generations in response.generations:
+            for generation in generations:
+                usage = getattr(getattr(generation, "message", None), "usage_metadata", None)
+                if usage:
+                    prompt_tokens += usage.get("input_tokens", 0)
+                    completion_tokens += usage.get("output_tokens", 0)
+                    cached_tokens += (usage.get("input_token_details") or {}).get("cache_read", 0) or 0
+        if not prompt_tokens and response.llm_output:
+            token_usage = response.llm_output.get("token_usage") or {}
+            prompt_tokens = token_usage.get("prompt_tokens", 0)
+            completion_tokens = token_usage.get("completion_tokens", 0)
+            cached_tokens = (token_usage.get("prompt_tokens_details") or {}).get("cached_tokens", 0) or 0
+        bump("prompt_tokens", prompt_tokens)
+        bump("completion_tokens", completion_tokens)
+        bump("cached_tokens", cached_tokens)
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        self._starts.pop(run_id, None)
+        bump("errors")
+
+    def on_retry(self, retry_state, *, run_id, **kwargs):
+        bump("retries")
+
+
+usage_handler = UsageCallbackHandler()
+
+
+def summarize(records: List[Dict]) -> List[Dict]:
+    """Aggregate records per node: calls, total and mean wall time, tokens"""
+    summary = {}
+    for record in records:
+        row = summary.setdefault(record["node"], {"node": record["node"], "calls": 0, "wall_time": 0.0,
+                                                  "llm_latency": 0.0, "prompt_tokens": 0, "completion_tokens": 0,
+                                                  "cached_tokens": 0, "retries": 0, "cache_hits": 0,
+                                                  "queue_wait": 0.0, "saved_tokens": 0})
+        row["calls"] += 1
+        for key in ["wall_time", "llm_latency", "prompt_tokens", "completion_tokens", "cached_tokens",
+                    "retries", "cache_hits", "queue_wait", "saved_tokens"]:
+            row[key] += record.get(key, 0)
+    for row in summary.values():
+        row["mean_wall_time"] = round(row["wall_time"] / row["calls"], 4)
+        row["wall_time"] = round(row["wall_time"], 4)
+        row["llm_latency"] = round(row["llm_latency"], 4)
+        row["queue_wait"] = round(row["queue_wait"], 4)
+        # share of the prompt served from the provider's prompt cache
+        row["cache_rate"] = round(row["cached_tokens"] / row["prompt_tokens"], 4) if row["prompt_tokens"] else 0.0
+    return list(summary.values())
+
+
+def export_metrics(records: List[Dict], path: str) -> str:
+    """Write records as csv or json depending on the file extension"""
+    if path.endswith(".json"):
+        with open(path, "w") as f:
+            json.dump(records, f, indent=4)
+    else:
+        with open(path, "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=METRIC_FIELDS, extrasaction="ignore")
+            writer.writeheader()
+            writer.writerows(records)
+    return path
@@ -0,0 +1,148 @@
+import os
+import json
+import time
+import heapq
+import random
+import itertools
+import threading
+import contextvars
+from contextlib import contextmanager
+import httpx
+from dotenv import load_dotenv
+
+from util.metrics import bump
+
+_ = load_dotenv()
+
+# lower value is served first
+INTERACTIVE = 0
+BATCH = 1
+
+_priority = contextvars.ContextVar("llm_priority", default=INTERACTIVE)
+
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+
+@contextmanager
+def priority(level: int):
+    """Run the model calls made in this context with the given priority class"""
+    token = _priority.set(level)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+class RateLimiter():
+    """Process wide requests and tokens per minute budget.
+
+    Both budgets are token buckets refilled continuously. Waiting callers are
+    served strictly by (priority, arrival), so a GUI request never queues
+    behind a batch of pending background calls. A limit of 0 disables it."""
+    def __init__(self, rpm: int = 10, tpm: int = 0):
+        self.rpm = rpm
+        self.tpm = tpm
+        self.requests = float(rpm)
+        self.tokens = float(tpm)
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self.waiting = []
+        self.counter = itertools.count()
+        self.cond = threading.Condition()
+
+    def _refill(self, now: float):
+        elapsed = now - self.updated
+        self.updated = now
+        if self.rpm:
+            self.requests = min(self.rpm, self.requests + elapsed * self.rpm / 60)
+        if self.tpm:
+            self.tokens = min(self.tpm, self.tokens + elapsed * self.tpm / 60)
+
+    def _delay(self, now: float, tokens: int) -> float:
+        delay = self.blocked_until - now
+        if self.rpm and self.requests < 1:
+            delay = max(delay, (1 - self.requests) * 60 / self.rpm)
+        if self.tpm and self.tokens < tokens:
+            delay = max(delay, (tokens - self.tokens) * 60 / self.tpm)
+        return delay
+
+    def acquire(self, tokens: int = 0, level: int = None) -> float:
+        """Block until the request fits in both budgets, returns the wait in seconds"""
+        level = _priority.get() if level is None else level
+        tokens = min(tokens, self.tpm) if self.tpm else 0
+        entry = (level, next(self.counter))
+        start = time.monotonic()
+        with self.cond:
+            heapq.heappush(self.waiting, entry)
+            while True:
+                now = time.monotonic()
+                self._refill(now)
+                if self.waiting[0] == entry:
+                    delay = self._delay(now, tokens)
+                    if delay <= 0:
+                        break
+                    self.cond.wait(delay)
+                else:
+                    self.cond.wait()
+            heapq.heappop(self.waiting)
+            if self.rpm:
+                self.requests -= 1
+            self.tokens -= tokens
+            self.cond.notify_all()
+        return time.monotonic() - start
+
+    def pause(self, seconds: float):
+        """Hold every caller, used when the endpoint reports it is overloaded"""
+        with self.cond:
+            self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+
+
+def estimate_tokens(request: httpx.Request) -> int:
+    """Rough prompt plus completion size of a chat completion request"""
+    try:
+        body = json.loads(request.content or b"{}")
+    except (ValueError, httpx.RequestNotRead):
+        return 0
+    prompt = len(json.dumps(body.get("messages", []))) // 4
+    return prompt + (body.get("max_tokens") or 1024)
+
+
+def retry_delay(response: httpx.Response, attempt: int, base: float = 1.0, cap: float = 60.0) -> float:
+    retry_after = response.headers.get("retry-after")
+    if retry_after:
+        try:
+            return min(float(retry_after), cap)
+        except ValueError:
+            pass
+    return random.uniform(0, min(cap, base * 2 ** attempt))  # full jitter
+
+
+class RateLimitedTransport(httpx.BaseTransport):
+    """httpx transport that waits for the shared limiter before each request and
+    retries 429/5xx responses with jittered backoff, honouring retry-after"""
+    def __init__(self, limiter: RateLimiter, transport: httpx.BaseTransport = None, max_retries: int = 5):
+        self.limiter = limiter
+        self.transport = transport or httpx.HTTPTransport()
+        self.max_retries = max_retries
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        tokens = estimate_tokens(request)
+        for attempt in range(self.max_retries + 1):
+            bump("queue_wait", round(self.limiter.acquire(tokens), 4))
+            response = self.transport.handle_request(request)
+            if response.status_code not in RETRY_STATUS or attempt == self.max_retries:
+                return response
+            response.close()
+            delay = retry_delay(response, attempt)
+            if response.status_code == 429:
+                self.limiter.pause(delay)
+            else:
+                time.sleep(delay)
+            bump("retries")
+        return response
+
+    def close(self):
+        self.transport.close()
+
+
+limiter = RateLimiter(int(os.environ.get("LLM_RPM", 10)), int(os.environ.get("LLM_TPM", 0)))
@@ -0,0 +1,90 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Tuple
+
+from util.rate_limiter import priority, BATCH
+
+
+def _drop_thread(checkpointer, thread_id: str):
+    if hasattr(checkpointer, "delete_thread"):
+        checkpointer.delete_thread(thread_id)
+    elif hasattr(checkpointer, "storage"):  # MemorySaver
+        checkpointer.storage.pop(thread_id, None)
+        for key in [key for key in checkpointer.writes if key[0] == thread_id]:
+            del checkpointer.writes[key]
+
+
+class Speculator():
+    """Runs the next node of a paused thread in the background while the user
+    reviews its output.
+
+    The paused state is forked into a scratch thread and the graph is resumed
+    there until the next node completes. When the user continues from the same
+    checkpoint the recorded node updates are replayed onto the real thread with
+    update_state(as_node=...), otherwise the speculation is thrown away."""
+    def __init__(self, graph, workers: int = 2):
+        self.graph = graph
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="speculation")
+        self.pending = {}  # thread_id -> (checkpoint_id, spec thread_id, future)
+        self.lock = threading.Lock()
+
+    def speculate(self, thread: Dict):
+        state = self.graph.get_state(thread)
+        if not state.next:
+            return
+        thread_id = thread["configurable"]["thread_id"]
+        checkpoint_id = state.config["configurable"]["checkpoint_id"]
+        spec_id = f"spec:{thread_id}:{checkpoint_id}"
+        self.discard(thread)
+        future = self.executor.submit(self._run, state, spec_id)
+        with self.lock:
+            self.pending[thread_id] = (checkpoint_id, spec_id, future)
+
+    def _run(self, state, spec_id: str) -> List[Tuple[str, Dict]]:
+        spec_thread = {"configurable": {"thread_id": spec_id}}
+        last_node = next(iter(state.metadata.get("writes") or {}), None)
+        self.graph.update_state(spec_thread, state.values, as_node=last_node)
+        updates = []
+        with priority(BATCH):  # never delay a user waiting on another thread
+            for chunk in self.graph.stream(None, spec_thread, stream_mode="updates",
+                                           interrupt_before=[], interrupt_after=list(state.next)):
+                updates += [(node, update) for node, update in chunk.items() if node != "__interrupt__"]
+        return updates
+
+    def commit(self, thread: Dict):
+        """Apply the speculated updates if the thread is still at the checkpoint
+        they were computed from. Returns the updates, or None if there is nothing
+        to commit and the caller has to run the graph itself"""
+        thread_id = thread["configurable"]["thread_id"]
+        with self.lock:
+            entry = self.pending.pop(thread_id, None)
+        if entry is None:
+            return None
+        checkpoint_id, spec_id, future = entry
+        current = self.graph.get_state(thread).config["configurable"]["checkpoint_id"]
+        try:
+            if current != checkpoint_id:
+                future.cancel()
+                return None
+            try:
+                updates = future.result()
+            except Exception as e:
+                print(f"Speculative run failed, running the node again: {e}")
+                return None
+            for node, update in updates:
+                for record in update.get("metrics", []) if isinstance(update, dict) else []:
+                    record["thread_id"] = thread_id
+                self.graph.update_state(thread, update, as_node=node)
+            return updates
+        finally:
+            future.add_done_callback(lambda _: _drop_thread(self.graph.checkpointer, spec_id))
+
+    def discard(self, thread: Dict):
+        """Forget the speculation of a thread, e.g. because its state was edited"""
+        thread_id = thread["configurable"]["thread_id"]
+        with self.lock:
+            entry = self.pending.pop(thread_id, None)
+        if entry is not None:
+            _, spec_id, future = entry
+            future.cancel()
+            future.add_done_callback(lambda _: _drop_thread(self.graph.checkpointer, spec_id))
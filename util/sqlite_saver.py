@@ -0,0 +1,273 @@
+import time
+import sqlite3
+import asyncio
+import threading
+from typing import Any, Dict, Iterator, AsyncIterator, Optional, Sequence, Tuple
+from langchain_core.runnables import RunnableConfig
+from langgraph.checkpoint.base import (
+    WRITES_IDX_MAP,
+    BaseCheckpointSaver,
+    ChannelVersions,
+    Checkpoint,
+    CheckpointMetadata,
+    CheckpointTuple,
+    get_checkpoint_id,
+)
+from langgraph.checkpoint.memory import MemorySaver
+from langgraph.checkpoint.serde.types import TASKS
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS checkpoints (
+    thread_id TEXT NOT NULL,
+    checkpoint_ns TEXT NOT NULL DEFAULT '',
+    checkpoint_id TEXT NOT NULL,
+    parent_checkpoint_id TEXT,
+    type TEXT,
+    checkpoint BLOB,
+    metadata_type TEXT,
+    metadata BLOB,
+    created_at REAL NOT NULL,
+    PRIMARY KEY (thread_id, checkpoint_ns, checkpoint_id)
+);
+CREATE TABLE IF NOT EXISTS writes (
+    thread_id TEXT NOT NULL,
+    checkpoint_ns TEXT NOT NULL DEFAULT '',
+    checkpoint_id TEXT NOT NULL,
+    task_id TEXT NOT NULL,
+    idx INTEGER NOT NULL,
+    channel TEXT NOT NULL,
+    type TEXT,
+    value BLOB,
+    PRIMARY KEY (thread_id, checkpoint_ns, checkpoint_id, task_id, idx)
+);
+CREATE TABLE IF NOT EXISTS threads (
+    thread_id TEXT PRIMARY KEY,
+    last_access REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_threads_last_access ON threads (last_access);
+"""
+
+
+class SqliteSaver(BaseCheckpointSaver[str]):
+    """File backed checkpointer with retention.
+
+    Checkpoints live in a WAL mode SQLite file keyed by (thread, namespace,
+    checkpoint id), so get_state_history is an index range scan. keep_last
+    bounds the checkpoints kept per thread and max_idle drops threads that
+    were not touched for that many seconds. Pruning, WAL truncation and
+    incremental vacuum run on a background thread every compact_interval seconds."""
+    def __init__(self, path: str, keep_last: Optional[int] = None, max_idle: Optional[float] = None,
+                 compact_interval: Optional[float] = 600, serde=None):
+        super().__init__(serde=serde)
+        self.path = path
+        # the latest checkpoint needs its parent for pending sends
+        self.keep_last = max(keep_last, 2) if keep_last else None
+        self.max_idle = max_idle
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+        self.conn.commit()
+        self._stop = threading.Event()
+        self._compactor = None
+        if compact_interval:
+            self._compactor = threading.Thread(target=self._compact_loop, args=(compact_interval,), daemon=True)
+            self._compactor.start()
+
+    get_next_version = MemorySaver.get_next_version
+
+    def _pending_sends(self, thread_id, checkpoint_ns, parent_checkpoint_id):
+        if not parent_checkpoint_id:
+            return []
+        rows = self.conn.execute(
+            "SELECT type, value FROM writes WHERE thread_id=? AND checkpoint_ns=? AND checkpoint_id=? AND channel=? "
+            "ORDER BY task_id, idx", (thread_id, checkpoint_ns, parent_checkpoint_id, TASKS)).fetchall()
+        return [self.serde.loads_typed((t, v)) for t, v in rows]
+
+    def _to_tuple(self, row) -> CheckpointTuple:
+        thread_id, checkpoint_ns, checkpoint_id, parent_checkpoint_id, type_, checkpoint, metadata_type, metadata = row
+        writes = self.conn.execute(
+            "SELECT task_id, channel, type, value FROM writes WHERE thread_id=? AND checkpoint_ns=? AND checkpoint_id=? "
+            "ORDER BY task_id, idx", (thread_id, checkpoint_ns, checkpoint_id)).fetchall()
+        return CheckpointTuple(
+            config={"configurable": {"thread_id": thread_id, "checkpoint_ns": checkpoint_ns,
+                                     "checkpoint_id": checkpoint_id}},
+            checkpoint={
+                **self.serde.loads_typed((type_, checkpoint)),
+                "pending_sends": self._pending_sends(thread_id, checkpoint_ns, parent_checkpoint_id),
+            },
+            metadata=self.serde.loads_typed((metadata_type, metadata)),
+            parent_config={"configurable": {"thread_id": thread_id, "checkpoint_ns": checkpoint_ns,
+                                            "checkpoint_id": parent_checkpoint_id}} if parent_checkpoint_id else None,
+            pending_writes=[(task_id, channel, self.serde.loads_typed((t, v))) for task_id, channel, t, v in writes],
+        )
+
+    def _touch(self, thread_id):
+        self.conn.execute("INSERT INTO threads (thread_id, last_access) VALUES (?, ?) "
+                          "ON CONFLICT(thread_id) DO UPDATE SET last_access=excluded.last_access",
+                          (thread_id, time.time()))
+
+    def get_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        columns = ("thread_id, checkpoint_ns, checkpoint_id, parent_checkpoint_id, type, checkpoint, "
+                   "metadata_type, metadata")
+        with self.lock:
+            if checkpoint_id := get_checkpoint_id(config):
+                row = self.conn.execute(
+                    f"SELECT {columns} FROM checkpoints WHERE thread_id=? AND checkpoint_ns=? AND checkpoint_id=?",
+                    (str(thread_id), checkpoint_ns, checkpoint_id)).fetchone()
+            else:
+                row = self.conn.execute(
+                    f"SELECT {columns} FROM checkpoints WHERE thread_id=? AND checkpoint_ns=? "
+                    "ORDER BY checkpoint_id DESC LIMIT 1", (str(thread_id), checkpoint_ns)).fetchone()
+            return self._to_tuple(row) if row else None
+
+    def list(self, config: Optional[RunnableConfig], *, filter: Optional[Dict[str, Any]] = None,
+             before: Optional[RunnableConfig] = None, limit: Optional[int] = None) -> Iterator[CheckpointTuple]:
+        query = ("SELECT thread_id, checkpoint_ns, checkpoint_id, parent_checkpoint_id, type, checkpoint, "
+                 "metadata_type, metadata FROM checkpoints")
+        where, params = [], []
+        if config:
+            where.append("thread_id=?")
+            params.append(str(config["configurable"]["thread_id"]))
+            if (checkpoint_ns := config["configurable"].get("checkpoint_ns")) is not None:
+                where.append("checkpoint_ns=?")
+                params.append(checkpoint_ns)
+            if checkpoint_id := get_checkpoint_id(config):
+                where.append("checkpoint_id=?")
+                params.append(checkpoint_id)
+        if before and (before_id := get_checkpoint_id(before)):
+            where.append("checkpoint_id<?")
+            params.append(before_id)
+        if where:
+            query += " WHERE " + " AND ".join(where)
+        query += " ORDER BY checkpoint_id DESC"
+        if limit is not None and not filter:
+            query += f" LIMIT {int(limit)}"
+        with self.lock:
+            rows = self.conn.execute(query, params).fetchall()
+        for row in rows:
+            if limit is not None and limit <= 0:
+                break
+            with self.lock:
+                item = self._to_tuple(row)
+            if filter and not all(item.metadata.get(k) == v for k, v in filter.items()):
+                continue
+            if limit is not None:
+                limit -= 1
+            yield item
+
+    def put(self, config: RunnableConfig, checkpoint: Checkpoint, metadata: CheckpointMetadata,
+            new_versions: ChannelVersions) -> RunnableConfig:
+        c = checkpoint.copy()
+        c.pop("pending_sends", None)
+        thread_id = str(config["configurable"]["thread_id"])
+        checkpoint_ns = config["configurable"]["checkpoint_ns"]
+        with self.lock:
+            # serialized under the lock so a concurrent blob sweep sees the new references
+            type_, data = self.serde.dumps_typed(c)
+            metadata_type, metadata_data = self.serde.dumps_typed(metadata)
+            self.conn.execute(
+                "INSERT OR REPLACE INTO checkpoints VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (thread_id, checkpoint_ns, checkpoint["id"], config["configurable"].get("checkpoint_id"),
+                 type_, data, metadata_type, metadata_data, time.time()))
+            self._touch(thread_id)
+            if self.keep_last:
+                self._prune_thread(thread_id, checkpoint_ns)
+            self.conn.commit()
+        return {"configurable": {"thread_id": thread_id, "checkpoint_ns": checkpoint_ns,
+                                 "checkpoint_id": checkpoint["id"]}}
+
+    def put_writes(self, config: RunnableConfig, writes: Sequence[Tuple[str, Any]], task_id: str) -> None:
+        thread_id = str(config["configurable"]["thread_id"])
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        checkpoint_id = config["configurable"]["checkpoint_id"]
+        with self.lock:
+            rows = []
+            for idx, (channel, value) in enumerate(writes):
+                type_, data = self.serde.dumps_typed(value)
+                rows.append((thread_id, checkpoint_ns, checkpoint_id, task_id, WRITES_IDX_MAP.get(channel, idx),
+                             channel, type_, data))
+            # special writes (errors, interrupts) are upserted, regular ones are written once
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO writes VALUES (?, ?, ?, ?, ?, ?, ?, ?)", [r for r in rows if r[4] < 0])
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO writes VALUES (?, ?, ?, ?, ?, ?, ?, ?)", [r for r in rows if r[4] >= 0])
+            self.conn.commit()
+
+    def _prune_thread(self, thread_id, checkpoint_ns):
+        cutoff = self.conn.execute(
+            "SELECT checkpoint_id FROM checkpoints WHERE thread_id=? AND checkpoint_ns=? "
+            "ORDER BY checkpoint_id DESC LIMIT 1 OFFSET ?", (thread_id, checkpoint_ns, self.keep_last - 1)).fetchone()
+        if cutoff:
+            for table in ["checkpoints", "writes"]:
+                self.conn.execute(f"DELETE FROM {table} WHERE thread_id=? AND checkpoint_ns=? AND checkpoint_id<?",
+                                  (thread_id, checkpoint_ns, cutoff[0]))
+
+    def delete_thread(self, thread_id):
+        with self.lock:
+            for table in ["checkpoints", "writes", "threads"]:
+                self.conn.execute(f"DELETE FROM {table} WHERE thread_id=?", (str(thread_id),))
+            self.conn.commit()
+
+    def thread_ids(self):
+        with self.lock:
+            return [row[0] for row in self.conn.execute("SELECT thread_id FROM threads ORDER BY last_access")]
+
+    def prune(self):
+        """Apply the retention policy to every thread"""
+        with self.lock:
+            if self.max_idle:
+                cutoff = time.time() - self.max_idle
+                for table in ["checkpoints", "writes"]:
+                    self.conn.execute(f"DELETE FROM {table} WHERE thread_id IN "
+                                      "(SELECT thread_id FROM threads WHERE last_access<?)", (cutoff,))
+                self.conn.execute("DELETE FROM threads WHERE last_access<?", (cutoff,))
+            if self.keep_last:
+                namespaces = self.conn.execute("SELECT DISTINCT thread_id, checkpoint_ns FROM checkpoints").fetchall()
+                for thread_id, checkpoint_ns in namespaces:
+                    self._prune_thread(thread_id, checkpoint_ns)
+            self.conn.commit()
+
+    def compact(self):
+        self.prune()
+        with self.lock:
+            if hasattr(self.serde, "sweep"):  # content addressed blobs, see util.dedup_serde
+                self.serde.sweep(self.conn.execute(
+                    "SELECT type, checkpoint FROM checkpoints UNION ALL SELECT type, value FROM writes"))
+            self.conn.execute("PRAGMA incremental_vacuum")
+            self.conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+    def _compact_loop(self, interval):
+        while not self._stop.wait(interval):
+            try:
+                self.compact()
+            except sqlite3.Error as e:
+                print(f"Checkpoint compaction failed: {e}")
+
+    def close(self):
+        self._stop.set()
+        with self.lock:
+            self.conn.close()
+
+    async def aget_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        return await asyncio.get_running_loop().run_in_executor(None, self.get_tuple, config)
+
+    async def alist(self, config: Optional[RunnableConfig], *, filter: Optional[Dict[str, Any]] = None,
+                    before: Optional[RunnableConfig] = None, limit: Optional[int] = None) -> AsyncIterator[CheckpointTuple]:
+        loop = asyncio.get_running_loop()
+        items = await loop.run_in_executor(None, lambda: list(self.list(config, filter=filter, before=before,
+                                                                         limit=limit)))
+        for item in items:
+            yield item
+
+    async def aput(self, config: RunnableConfig, checkpoint: Checkpoint, metadata: CheckpointMetadata,
+                   new_versions: ChannelVersions) -> RunnableConfig:
+        return await asyncio.get_running_loop().run_in_executor(None, self.put, config, checkpoint, metadata,
+                                                                new_versions)
+
+    async def aput_writes(self, config: RunnableConfig, writes: Sequence[Tuple[str, Any]], task_id: str) -> None:
+        return await asyncio.get_running_loop().run_in_executor(None, self.put_writes, config, writes, task_id)
@@ -0,0 +1,85 @@
+import json
+from typing import Dict
+
+
+def chunk_text(message) -> str:
+    """Visible text of a streamed message chunk, including partial tool call
+    arguments so structured outputs show up while they are generated"""
+    text = message.content if isinstance(message.content, str) else ""
+    for tool_call in getattr(message, "tool_call_chunks", None) or []:
+        text += tool_call.get("args") or ""
+    return text
+
+
+def stream_until_interrupt(graph, config, thread):
+    """Run the graph until it pauses. Yields ("token", node, text) for every
+    model token and ("update", node, output) when a node completes"""
+    for mode, chunk in graph.stream(config, thread, stream_mode=["messages", "updates"]):
+        if mode == "messages":
+            message, metadata = chunk
+            text = chunk_text(message)
+            if text:
+                yield "token", metadata.get("langgraph_node"), text
+        else:
+            for node, output in chunk.items():
+                if node != "__interrupt__":
+                    yield "update", node, output
+
+
+class FieldWatcher():
+    """Top level fields of a JSON object whose values are complete while the
+    rest of the object is still being generated. Feed it the text as it arrives"""
+    def __init__(self):
+        self.decoder = json.JSONDecoder()
+        self.text = ""
+        self.position = None  # just after the last complete field
+        self.fields = {}
+
+    def _skip(self, i: int) -> int:
+        while i < len(self.text) and self.text[i] in " \t\r\n,":
+            i += 1
+        return i
+
+    def feed(self, text: str) -> Dict:
+        """Fields completed by this piece of text"""
+        self.text += text
+        completed = {}
+        if self.position is None:
+            i = self._skip(0)
+            if i >= len(self.text):
+                return completed
+            if self.text[i] != "{":
+                raise ValueError(f"Expected a JSON object, got {self.text[:20]!r}")
+            self.position = i + 1
+        while True:
+            i = self._skip(self.position)
+            if i >= len(self.text) or self.text[i] == "}":
+                return completed
+            try:
+                key, i = self.decoder.raw_decode(self.text, i)
+                i = self.text.index(":", i) + 1
+                while i < len(self.text) and self.text[i] in " \t\r\n":
+                    i += 1
+                value, end = self.decoder.raw_decode(self.text, i)
+            except ValueError:  # the field is still being generated
+                return completed
+            if end == len(self.text) and not isinstance(value, (str, list, dict)):
+                return completed  # a number or literal may continue in the next chunk
+            completed[key] = self.fields[key] = value
+            self.position = end
+
+
+def stream_fields(runnable, messages):
+    """Stream a tool bound model forced to answer with one tool call and yield
+    (name, value) for each argument as soon as it is complete. Stopping the
+    iteration closes the request"""
+    watcher = FieldWatcher()
+    for chunk in runnable.stream(messages):
+        chunks = getattr(chunk, "tool_call_chunks", None) or []
+        if chunks:
+            text = "".join(c.get("args") or "" for c in chunks if c.get("index") in (None, 0))
+        elif getattr(chunk, "tool_calls", None):  # models without streaming answer in one message
+            text = json.dumps(chunk.tool_calls[0]["args"])
+        else:
+            continue
+        yield from watcher.feed(text).items()